@@ -1,17 +1,30 @@
 import tkinter as tk
+import sys
 import time
+from datetime import datetime
 from os import makedirs
 from os.path import expanduser
 from os.path import isfile
 import pandas as pd
 
 from polodata import PoloData
+from orders import OrderPipeline
+from scanner import MarketScanner
+from alerts import AlertEngine
+from replay import ReplaySource
+from sharedfeed import SharedPoloData
+from profiler import ChartProfiler
+from arrowexport import ArrowExport
+from papertrade import PaperExchange
 
 # global variables
 apptitle = "PoloBot v0.2"
 chartpath = expanduser("~/charts/")
 makedirs(chartpath, exist_ok=True)
+watchlistfile = chartpath + 'watchlist.txt'
 SM_MONO = ("mono", 6)
+# seconds to wait for a watchlist to load before reporting what did
+watchlist_timeout = 120
 
 
 class MainWindow(tk.Tk):
@@ -25,6 +38,9 @@ class MainWindow(tk.Tk):
         filemenu = tk.Menu(menubar, tearoff=0)
         filemenu.add_command(label="Options", command=self.bell())
         filemenu.add_separator()
+        filemenu.add_command(label="Open Watchlist", command=self._open_watchlist)
+        filemenu.add_command(label="Save Watchlist", command=self._save_watchlist)
+        filemenu.add_separator()
         filemenu.add_command(label="Exit", command=self._stop_everything)
         menubar.add_cascade(label="File", menu=filemenu)
 
@@ -52,12 +68,24 @@ class MainWindow(tk.Tk):
                 market_menu.add_cascade(label=mkt + str(idx), menu=submenu)
 
         menubar.add_cascade(label="Markets", menu=market_menu)
+        menubar.add_command(label="Scanner", command=self._open_scanner)
         self.config(menu=menubar)
+        self._scanner_window = None
 
         self.balances_frame = tk.Frame(self)
         self.balances_frame.pack(expand=1, fill='both')
-        self._after_id = self.after(2500, self._display_balances)
+        self.alert_label = tk.Label(self, text="", fg='red')
+        self.alert_label.pack(side='bottom', fill='x')
+        self.status_label = tk.Label(self, text="", font=SM_MONO)
+        self.status_label.pack(side='bottom', fill='x')
+        if replay is not None:
+            self.replay_label = tk.Label(self, text="", font=SM_MONO)
+            self.replay_label.pack(side='bottom', fill='x')
+            self.after(1000, self._display_replay)
 
+        self._after_id = self.after(2500, self._display_balances)
+        self.after(100, self._dispatch_orders)
+        self.after(500, self._display_alerts)
 
         self.protocol("WM_DELETE_WINDOW", self._stop_everything)
 
@@ -67,17 +95,64 @@ class MainWindow(tk.Tk):
         market_window.title(market + " - " + apptitle)
         market_window.maxsize(width=1600, height=1024)
         market_window.minsize(width=640, height=400)
+        market_window.protocol("WM_DELETE_WINDOW", lambda w=market_window, m=market: self._close_market(w, m))
         market = ChartFrame(market_window, market, 400, 400)
         market.pack(fill=tk.BOTH, expand=tk.YES)
 
+    def _close_market(self, market_window, market):
+        pdat.set_chart_visible(market, False)
+        market_window.destroy()
+
+    def _open_watchlist(self):
+        markets = read_watchlist()
+        if len(markets) > 0:
+            # load every history in parallel first, the windows fill in as their data arrives
+            start = time.time()
+            pdat.prefetch_charts(markets)
+            for market in markets:
+                self._open_market(market)
+            self.status_label["text"] = "Opening {0} markets...".format(len(markets))
+            self.after(100, lambda: self._watch_open(markets, start))
+
+    def _watch_open(self, markets, start):
+        # markets that failed are left to the charts thread to retry, they don't hold up the count
+        loaded = [m for m in markets if pdat.charts.get(m) is not None]
+        failed = [m for m in markets if m not in loaded]
+        waiting = [m for m in failed if m not in pdat.chart_errors]
+        if len(waiting) == 0 or time.time() - start > watchlist_timeout:
+            self.status_label["text"] = "Opened {0} markets in {1:.1f}s".format(len(loaded), time.time() - start)
+            if len(failed) > 0:
+                self.status_label["text"] += ", not loaded: " + " ".join(failed)
+            print(self.status_label["text"])
+        else:
+            self.after(100, lambda: self._watch_open(markets, start))
+
+    def _save_watchlist(self):
+        markets = sorted(m for m in pdat.chart_visible if pdat.chart_visible[m] > 0)
+        with open(watchlistfile, 'w') as f:
+            f.write("\n".join(markets))
+        self.status_label["text"] = "Saved {0} markets to watchlist".format(len(markets))
+
+    def _open_scanner(self):
+        if self._scanner_window is None:
+            self._scanner_window = ScannerWindow(self._open_market)
+            self._scanner_window.protocol("WM_DELETE_WINDOW", self._scanner_window_close)
+
+    def _scanner_window_close(self):
+        self._scanner_window.destroy()
+        self._scanner_window = None
+
     def _stop_everything(self):
         pdat.stop_ticker()
         pdat.stop_charts()
+        pdat.stop_orders()
+        orders.stop()
         self.destroy()
         quit(0)
 
     def _display_balances(self):
-        if pdat.balances is not None:
+        balances = account_balances()
+        if balances is not None:
             self.balances_frame.destroy()
             self.balances_frame = tk.Frame(self)
             self.balances_frame.pack(expand=1, fill='both')
@@ -86,26 +161,45 @@ class MainWindow(tk.Tk):
             tk.Label(self.balances_frame, text="Available").grid(row=row, column=1, padx=10)
             tk.Label(self.balances_frame, text="On Orders").grid(row=row, column=2, padx=10)
             tk.Label(self.balances_frame, text="BTC Value").grid(row=row, column=3, padx=10)
-            for c in sorted(pdat.balances):
+            for c in sorted(balances):
                 row += 1
-                if float(pdat.balances[c]['btcValue']) > 0.0:
-                    available = '{:.8f}'.format(float(pdat.balances[c]['available']))[:10]
-                    onorders = '{:.8f}'.format(float(pdat.balances[c]['onOrders']))[:10]
-                    btcvalue = '{:.8f}'.format(float(pdat.balances[c]['btcValue']))[:10]
+                if float(balances[c]['btcValue']) > 0.0:
+                    available = '{:.8f}'.format(float(balances[c]['available']))[:10]
+                    onorders = '{:.8f}'.format(float(balances[c]['onOrders']))[:10]
+                    btcvalue = '{:.8f}'.format(float(balances[c]['btcValue']))[:10]
                     tk.Label(self.balances_frame, text=c).grid(row=row, column=0, padx=10, sticky="nsew")
                     tk.Label(self.balances_frame, text=available).grid(row=row, column=1, padx=10)
                     tk.Label(self.balances_frame, text=onorders).grid(row=row, column=2, padx=10)
                     tk.Label(self.balances_frame, text=btcvalue).grid(row=row, column=3, padx=10)
         self._after_id = self.after(2500, self._display_balances)
 
+    def _dispatch_orders(self):
+        orders.dispatch()
+        self.after(100, self._dispatch_orders)
+
+    def _display_replay(self):
+        stats = replay.stats()
+        self.replay_label["text"] = "Replay {0:%d%b %H:%M} x{1}  Frames:{2} Coalesced:{3} Dropped:{4} " \
+                                    "Not drawn:{5}".format(stats['sim_time'], stats['speed'], stats['frames'],
+                                                           stats['coalesced'], stats['dropped'], stats['missed'])
+        self.after(1000, self._display_replay)
+
+    def _display_alerts(self):
+        fired = alerts.poll()
+        if len(fired) > 0:
+            self.bell()
+            self.alert_label["text"] = "\n".join(str(a) for a in fired[-3:])
+        self.after(500, self._display_alerts)
+
 class ChartFrame(tk.Frame):
+    profile_phases = ['_fetch_chart', '_update_labels', '_resample_data', '_add_indicators', '_layout_chart',
+                      '_render']
+
     def __init__(self, parent, market, width, height):
         tk.Frame.__init__(self, parent)
 
         self.market = market
-        while market not in pdat.charts:
-            time.sleep(0.5)
-        self.chart_data = pdat.charts[market]
+        self.chart_data = pdat.charts.get(market)
         self.width = width
         self.height = height
         self.x_scale = 1
@@ -114,6 +208,7 @@ class ChartFrame(tk.Frame):
         self.candle_width = 10
         self.label_width = 42
         self.offset = -1
+        self.history_start = None
         self.candle_freq = '30Min'
         self.visible_data_length = None
         self.indicator = 'macd'
@@ -126,7 +221,9 @@ class ChartFrame(tk.Frame):
 
         self._buy_window = None
         self._sell_window = None
+        self._alert_window = None
         self._cfg_win = None
+        self._profiler = None
 
         self.market_info = tk.StringVar()
         self.market_info.set(self.market)
@@ -181,175 +278,227 @@ class ChartFrame(tk.Frame):
         self.sell_price_label.pack(side='left')
         button = tk.Button(button_frame, text='Auto')
         button.pack(side='right')
+        button = tk.Button(button_frame, text='Alert', command=self._alert)
+        button.pack(side='right')
 
+        if "--profile" in sys.argv:
+            self.set_profiling(True)
         self.after(1000, self._update_data)
 
     def _update_data(self):
         if pdat.charts[self.market] is not None:
-            self.chart_data = pdat.charts[self.market]
-            label_string = self.market + "\n"
-            label_string += "24hr Low:" + "{:.8f}".format(pdat.ticker.ix[self.market, "low24hr"])[:10] + "  "
-            label_string += "24hr High:" + "{:.8f}".format(pdat.ticker.ix[self.market, "high24hr"])[:10] + "\n"
-            label_string += "Volume:" + "{:.2f}".format(pdat.ticker.ix[self.market, "baseVolume"]) + "  "
-            label_string += "Change:" + "{:.2f}".format(pdat.ticker.ix[self.market, "percentChange"] * 100) + "%"
-            self.market_info.set(label_string)
-
-            self.buy_price_label["text"] = "{:.8f}".format(pdat.ticker.ix[self.market, "lowestAsk"])[:10]
-            self.sell_price_label["text"] = "{:.8f}".format(pdat.ticker.ix[self.market, "highestBid"])[:10]
+            self._fetch_chart()
+            self._update_labels()
             self.draw_chart()
+            if replay is not None:
+                replay.rendered(id(self))
         else:
             label_string = "Waiting for market data for " + self.market
             self.market_info.set(label_string)
-        self.after(1000, self._update_data)
+        self.after(1000 if replay is None else replay.frame_interval_ms, self._update_data)
+
+    def _fetch_chart(self):
+        self.chart_data = pdat.get_chart(self.market, self.history_start)
+
+    def _update_labels(self):
+        label_string = self.market + "\n"
+        label_string += "24hr Low:" + "{:.8f}".format(pdat.ticker.ix[self.market, "low24hr"])[:10] + "  "
+        label_string += "24hr High:" + "{:.8f}".format(pdat.ticker.ix[self.market, "high24hr"])[:10] + "\n"
+        label_string += "Volume:" + "{:.2f}".format(pdat.ticker.ix[self.market, "baseVolume"]) + "  "
+        label_string += "Change:" + "{:.2f}".format(pdat.ticker.ix[self.market, "percentChange"] * 100) + "%"
+        if account.orders_active:
+            label_string += "\nPosition:" + "{:.8f}".format(account.position(self.market))[:10] + "  "
+            label_string += "Traded:" + "{:.8f}".format(account.traded_since_start(self.market))[:10] + "  "
+            label_string += "Open Orders:" + str(len(account.get_open_orders(self.market)))
+        self.market_info.set(label_string)
+
+        self.buy_price_label["text"] = "{:.8f}".format(pdat.ticker.ix[self.market, "lowestAsk"])[:10]
+        self.sell_price_label["text"] = "{:.8f}".format(pdat.ticker.ix[self.market, "highestBid"])[:10]
 
     def draw_chart(self):
+        # split into phases so a ChartProfiler can time each one, see set_profiling
         if self.chart_data is not None:
-            self.canvas.delete("chart")
-
-            x1 = self.width * 0.01
-            y1 = self.height * 0.01
-            x2 = self.width * 0.99
-            y2 = self.height * 0.75
-
-            y3 = self.height * 0.79
-            y4 = self.height * 0.99
-            y5 = (y3 + y4) / 2
-
-            first_full_day = (self.chart_data.index.to_period('H')[0] + 1).to_timestamp()
-            data = self.chart_data[first_full_day:]
-
-            data = data.resample(self.candle_freq).agg(
-                {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum',
-                 'weightedAverage': 'last'})
-            self.data_length = data.shape[0]
-            for a in range(2):
-                data['sma' + str(a)] = data['weightedAverage'].rolling(self.sma[a]).mean()
-                data['ema' + str(a)] = data['weightedAverage'].ewm(self.ema[a]).mean()
-
-            line30 = self._get_y(30, 0, 100, y4 - y3, y4)
-            line50 = self._get_y(50, 0, 100, y4 - y3, y4)
-            line70 = self._get_y(70, 0, 100, y4 - y3, y4)
-
-            m, s, h = pdat.calculate_macd(data['close'],
-                                          self.macd['ema_fast'], self.macd['ema_slow'], self.macd['ema_signal'])
-            data['MACDLine'] = m
-            data['SignalLine'] = s
-            data['Histogram'] = h
-
-            data['rsi'] = pdat.calculate_rsi(data['close'], self.rsi['periods'])
-            if self.indicator == 'rsi':
-                self.canvas.create_line(x1 + self.label_width, line30, x2, line30, fill='red', tags='chart')
-                self.canvas.create_line(x1 + self.label_width, line50, x2, line50, fill='black', tags='chart')
-                self.canvas.create_line(x1 + self.label_width, line70, x2, line70, fill='green', tags='chart')
-                self.canvas.create_text(x1 + self.label_width - 3, line50, text="RSI", anchor='e', tags='chart')
-            elif self.indicator == 'macd':
-                self.canvas.create_text(x1 + self.label_width - 3, line50, text="MACD", anchor='e', tags='chart')
-
-            width = x2 - x1
-            height = y2 - y1
-
-            candle_count = int((width - self.label_width) // self.candle_width)
-            visible_data = data[self.offset - candle_count:self.offset]
-
-            y_max = visible_data["high"].max()
-            y_min = visible_data["low"].min()
-            v_max = visible_data["volume"].max()
-
-            macd_max = visible_data["MACDLine"].max() if visible_data["MACDLine"].max() > visible_data[
-                "SignalLine"].max() else visible_data["SignalLine"].max()
-            macd_min = visible_data["MACDLine"].min() if visible_data["MACDLine"].min() < visible_data[
-                "SignalLine"].min() else visible_data["SignalLine"].min()
-            if macd_max < -macd_min:
-                macd_max = -macd_min
-
-            y = y_max
-            y_step = ((y_max - y_min) / 10)
-            for _ in range(11):
-                self.canvas.create_text(x1 + self.label_width, self._get_y(y, y_min, y_max, height, y2),
-                                        text="{0:<10.8f}".format(y)[:10], anchor='e', font=('Times', 6), tags='chart')
-                self.canvas.create_line(x1 + self.label_width, self._get_y(y, y_min, y_max, height, y2),
-                                        x2, self._get_y(y, y_min, y_max, height, y2), fill='#c0c0d0', tags='chart')
-                y -= y_step
-
-            d = visible_data.ix[0].name.strftime("%d%b %H:%M")
-            self.canvas.create_text(x1 + self.label_width, y2 + 2,
-                                    text=d, anchor='nw', font=('Times', 6), tags='chart')
-            d = visible_data.ix[-1].name.strftime("%d%b %H:%M")
-            self.canvas.create_text(x2, y2 + 2,
-                                    text=d, anchor='ne', font=('Times', 6), tags='chart')
-
-            x = x1 + self.label_width + (self.candle_width / 2)
-            old_x = x
-            old_macd = None
-            old_sig = None
-            old_sma = [None, None, None]
-            old_ema = [None, None, None]
-            old_rsi = None
-
-            for i in visible_data.index:
-                high = self._get_y(visible_data.ix[i, "high"], y_min, y_max, height, y2)
-                low = self._get_y(visible_data.ix[i, "low"], y_min, y_max, height, y2)
-                open = self._get_y(visible_data.ix[i, "open"], y_min, y_max, height, y2)
-                close = self._get_y(visible_data.ix[i, "close"], y_min, y_max, height, y2)
-                volume = self._get_y(visible_data.ix[i, "volume"] / 2, 0, v_max, height, y2)
-
-                self.canvas.create_rectangle(x - (self.candle_width // 2) + 1, y2,
-                                             x + (self.candle_width // 2) - 1, volume,
-                                             outline='#e0e0e0', fill='#e0e0e0', tags='chart')
-
-                self.canvas.create_line(x, high, x, low, tags='chart')
-                c = '#b04050' if open < close else '#50c040'
-                self.canvas.create_rectangle(x - (self.candle_width // 2) + 1, open,
-                                             x + (self.candle_width // 2) - 1, close,
-                                             fill=c, outline=c, tags='chart')
-                if self.indicator == 'macd':
-                    hist = visible_data.ix[i, "Histogram"]
-                    c = '#b04050' if hist < 0 else '#50c040'
-                    hist = self._get_y(hist, -macd_max, macd_max, y4 - y3, y4)
-                    macd = self._get_y(visible_data.ix[i, "MACDLine"], -macd_max, macd_max, y4 - y3, y4)
-                    sig = self._get_y(visible_data.ix[i, "SignalLine"], -macd_max, macd_max, y4 - y3, y4)
-
-                    self.canvas.create_rectangle(x - (self.candle_width // 2) + 1, y5,
-                                                 x + (self.candle_width // 2) - 1, hist,
-                                                 outline=c, fill=c, tags='chart')
-
-                    if old_macd is None:
-                        old_macd = macd
-                        old_sig = sig
-                    self.canvas.create_line(old_x, old_macd, x, macd, fill='#000000', tags='chart')
-                    self.canvas.create_line(old_x, old_sig, x, sig, fill='#ff0000', tags='chart')
+            data = self._resample_data()
+            data = self._add_indicators(data)
+            items = self._layout_chart(data)
+            self._render(items)
+
+    def _resample_data(self):
+        first_full_day = (self.chart_data.index.to_period('H')[0] + 1).to_timestamp()
+        data = self.chart_data[first_full_day:]
+
+        data = data.resample(self.candle_freq).agg(
+            {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum',
+             'weightedAverage': 'last'})
+        self.data_length = data.shape[0]
+        return data
+
+    def _add_indicators(self, data):
+        for a in range(2):
+            data['sma' + str(a)] = data['weightedAverage'].rolling(self.sma[a]).mean()
+            data['ema' + str(a)] = data['weightedAverage'].ewm(self.ema[a]).mean()
+
+        m, s, h = pdat.calculate_macd(data['close'],
+                                      self.macd['ema_fast'], self.macd['ema_slow'], self.macd['ema_signal'])
+        data['MACDLine'] = m
+        data['SignalLine'] = s
+        data['Histogram'] = h
+
+        data['rsi'] = pdat.calculate_rsi(data['close'], self.rsi['periods'])
+        return data
+
+    def _layout_chart(self, data):
+        # works out everything to draw as (kind, coords, options), nothing touches the canvas until _render
+        items = []
+
+        x1 = self.width * 0.01
+        y1 = self.height * 0.01
+        x2 = self.width * 0.99
+        y2 = self.height * 0.75
+
+        y3 = self.height * 0.79
+        y4 = self.height * 0.99
+        y5 = (y3 + y4) / 2
+
+        line30 = self._get_y(30, 0, 100, y4 - y3, y4)
+        line50 = self._get_y(50, 0, 100, y4 - y3, y4)
+        line70 = self._get_y(70, 0, 100, y4 - y3, y4)
+
+        if self.indicator == 'rsi':
+            items.append(('line', (x1 + self.label_width, line30, x2, line30), {'fill': 'red'}))
+            items.append(('line', (x1 + self.label_width, line50, x2, line50), {'fill': 'black'}))
+            items.append(('line', (x1 + self.label_width, line70, x2, line70), {'fill': 'green'}))
+            items.append(('text', (x1 + self.label_width - 3, line50), {'text': "RSI", 'anchor': 'e'}))
+        elif self.indicator == 'macd':
+            items.append(('text', (x1 + self.label_width - 3, line50), {'text': "MACD", 'anchor': 'e'}))
+
+        width = x2 - x1
+        height = y2 - y1
+
+        candle_count = int((width - self.label_width) // self.candle_width)
+        visible_data = data[self.offset - candle_count:self.offset]
+
+        y_max = visible_data["high"].max()
+        y_min = visible_data["low"].min()
+        v_max = visible_data["volume"].max()
+
+        macd_max = visible_data["MACDLine"].max() if visible_data["MACDLine"].max() > visible_data[
+            "SignalLine"].max() else visible_data["SignalLine"].max()
+        macd_min = visible_data["MACDLine"].min() if visible_data["MACDLine"].min() < visible_data[
+            "SignalLine"].min() else visible_data["SignalLine"].min()
+        if macd_max < -macd_min:
+            macd_max = -macd_min
+
+        y = y_max
+        y_step = ((y_max - y_min) / 10)
+        for _ in range(11):
+            items.append(('text', (x1 + self.label_width, self._get_y(y, y_min, y_max, height, y2)),
+                          {'text': "{0:<10.8f}".format(y)[:10], 'anchor': 'e', 'font': ('Times', 6)}))
+            items.append(('line', (x1 + self.label_width, self._get_y(y, y_min, y_max, height, y2),
+                                   x2, self._get_y(y, y_min, y_max, height, y2)), {'fill': '#c0c0d0'}))
+            y -= y_step
+
+        d = visible_data.ix[0].name.strftime("%d%b %H:%M")
+        items.append(('text', (x1 + self.label_width, y2 + 2), {'text': d, 'anchor': 'nw', 'font': ('Times', 6)}))
+        d = visible_data.ix[-1].name.strftime("%d%b %H:%M")
+        items.append(('text', (x2, y2 + 2), {'text': d, 'anchor': 'ne', 'font': ('Times', 6)}))
+
+        x = x1 + self.label_width + (self.candle_width / 2)
+        old_x = x
+        old_macd = None
+        old_sig = None
+        old_sma = [None, None, None]
+        old_ema = [None, None, None]
+        old_rsi = None
+
+        for i in visible_data.index:
+            high = self._get_y(visible_data.ix[i, "high"], y_min, y_max, height, y2)
+            low = self._get_y(visible_data.ix[i, "low"], y_min, y_max, height, y2)
+            open = self._get_y(visible_data.ix[i, "open"], y_min, y_max, height, y2)
+            close = self._get_y(visible_data.ix[i, "close"], y_min, y_max, height, y2)
+            volume = self._get_y(visible_data.ix[i, "volume"] / 2, 0, v_max, height, y2)
+
+            items.append(('rectangle', (x - (self.candle_width // 2) + 1, y2,
+                                        x + (self.candle_width // 2) - 1, volume),
+                          {'outline': '#e0e0e0', 'fill': '#e0e0e0'}))
+
+            items.append(('line', (x, high, x, low), {}))
+            c = '#b04050' if open < close else '#50c040'
+            items.append(('rectangle', (x - (self.candle_width // 2) + 1, open,
+                                        x + (self.candle_width // 2) - 1, close),
+                          {'fill': c, 'outline': c}))
+            if self.indicator == 'macd':
+                hist = visible_data.ix[i, "Histogram"]
+                c = '#b04050' if hist < 0 else '#50c040'
+                hist = self._get_y(hist, -macd_max, macd_max, y4 - y3, y4)
+                macd = self._get_y(visible_data.ix[i, "MACDLine"], -macd_max, macd_max, y4 - y3, y4)
+                sig = self._get_y(visible_data.ix[i, "SignalLine"], -macd_max, macd_max, y4 - y3, y4)
+
+                items.append(('rectangle', (x - (self.candle_width // 2) + 1, y5,
+                                            x + (self.candle_width // 2) - 1, hist),
+                              {'outline': c, 'fill': c}))
+
+                if old_macd is None:
                     old_macd = macd
                     old_sig = sig
-
-                elif self.indicator == 'rsi':
-                    rsi = self._get_y(visible_data.ix[i, "rsi"], 0, 100, y4 - y3, y4)
-                    if old_rsi is None:
-                        old_rsi = rsi
-                    self.canvas.create_line(old_x, old_rsi, x, rsi, fill='#7f7f7f', tags='chart')
+                items.append(('line', (old_x, old_macd, x, macd), {'fill': '#000000'}))
+                items.append(('line', (old_x, old_sig, x, sig), {'fill': '#ff0000'}))
+                old_macd = macd
+                old_sig = sig
+
+            elif self.indicator == 'rsi':
+                rsi = self._get_y(visible_data.ix[i, "rsi"], 0, 100, y4 - y3, y4)
+                if old_rsi is None:
                     old_rsi = rsi
-
-                for a in range(3):
-                    if self.sma[a] > 0:
-                        sma = self._get_y(visible_data.ix[i, 'sma' + str(a)], y_min, y_max, height, y2)
-                        if not pd.isnull(sma):
-                            if old_sma[a] is None:
-                                old_sma[a] = sma
-                            self.canvas.create_line(old_x, old_sma[a], x, sma, fill=self.sma_cols[a], tags='chart')
+                items.append(('line', (old_x, old_rsi, x, rsi), {'fill': '#7f7f7f'}))
+                old_rsi = rsi
+
+            for a in range(3):
+                if self.sma[a] > 0:
+                    sma = self._get_y(visible_data.ix[i, 'sma' + str(a)], y_min, y_max, height, y2)
+                    if not pd.isnull(sma):
+                        if old_sma[a] is None:
                             old_sma[a] = sma
+                        items.append(('line', (old_x, old_sma[a], x, sma), {'fill': self.sma_cols[a]}))
+                        old_sma[a] = sma
 
-                    if self.ema[a] > 0:
-                        ema = self._get_y(visible_data.ix[i, 'ema' + str(a)], y_min, y_max, height, y2)
-                        if not pd.isnull(ema):
-                            if old_ema[a] is None:
-                                old_ema[a] = ema
-                            self.canvas.create_line(old_x, old_ema[a], x, ema, fill=self.ema_cols[a], tags='chart')
+                if self.ema[a] > 0:
+                    ema = self._get_y(visible_data.ix[i, 'ema' + str(a)], y_min, y_max, height, y2)
+                    if not pd.isnull(ema):
+                        if old_ema[a] is None:
                             old_ema[a] = ema
+                        items.append(('line', (old_x, old_ema[a], x, ema), {'fill': self.ema_cols[a]}))
+                        old_ema[a] = ema
 
-                old_x = x
-                x += self.candle_width
-
-            self.canvas.create_rectangle(x1 + self.label_width, y1, x2, y2, fill='', tags='chart')
-            self.canvas.create_rectangle(x1 + self.label_width, y3, x2, y4, fill='', tags='chart')
+            old_x = x
+            x += self.candle_width
+
+        items.append(('rectangle', (x1 + self.label_width, y1, x2, y2), {'fill': ''}))
+        items.append(('rectangle', (x1 + self.label_width, y3, x2, y4), {'fill': ''}))
+        return items
+
+    def _render(self, items):
+        self.canvas.delete("chart")
+        create = {'line': self.canvas.create_line,
+                  'rectangle': self.canvas.create_rectangle,
+                  'text': self.canvas.create_text}
+        for kind, coords, options in items:
+            create[kind](*coords, tags='chart', **options)
+
+    def set_profiling(self, on):
+        # timing is only wrapped around this frame's methods while it is switched on
+        if on:
+            if self._profiler is None:
+                self._profiler = ChartProfiler(self, self.profile_phases)
+            self._profiler.attach()
+        elif self._profiler is not None:
+            self._profiler.detach()
+
+    def dump_profile(self):
+        if self._profiler is not None:
+            filename = chartpath + "profile_" + self.market + ".csv"
+            self._profiler.dump(filename)
+            print("Saved", len(self._profiler.history), "frames to", filename)
 
     def _get_y(self, y_in, y_min, y_max, height, bottom):
         y_out = ((y_in - y_min) / (y_max - y_min)) * height
@@ -367,6 +516,13 @@ class ChartFrame(tk.Frame):
             self.offset = -1
         if self.offset < -self.data_length + 12:
             self.offset = -self.data_length + 12
+            # scrolled past what is in memory, page the previous window in from disk
+            self.history_start = self.chart_data.index[0] - pdat.chart_retention
+            self.chart_data = pdat.get_chart(self.market, self.history_start)
+        elif self.offset == -1 and self.history_start is not None:
+            self.history_start = None
+            pdat.release_history(self.market)
+            self.chart_data = pdat.get_chart(self.market)
 
         self.draw_chart()
 
@@ -444,6 +600,10 @@ class ChartFrame(tk.Frame):
             self.rsi_periods.insert(0, self.rsi['periods'])
             self.rsi_periods.grid(row=4, column=3)
 
+            self.profiling = tk.IntVar()
+            self.profiling.set(1 if self._profiler is not None and self._profiler.attached else 0)
+            tk.Checkbutton(self._cfg_win, text="Profile", variable=self.profiling).grid(row=7, column=0)
+            tk.Button(self._cfg_win, text="Dump Profile", command=self.dump_profile).grid(row=7, column=1)
             tk.Button(self._cfg_win, text="OK", command=self.config_ok).grid(row=7, column=3, sticky='e')
 
             self._cfg_win.protocol("WM_DELETE_WINDOW", self._cfg_win_close)
@@ -457,6 +617,7 @@ class ChartFrame(tk.Frame):
             self.macd['ema_slow'] = int(self.macd_s_ema.get())
             self.macd['ema_signal'] = int(self.macd_sig_ema.get())
             self.rsi['periods'] = int(self.rsi_periods.get())
+            self.set_profiling(self.profiling.get() == 1)
 
             self._cfg_win.destroy()
             self._cfg_win = None
@@ -486,6 +647,87 @@ class ChartFrame(tk.Frame):
         self._sell_window.destroy()
         self._sell_window = None
 
+    def _alert(self):
+        if self._alert_window is None:
+            self._alert_window = AlertWindow(self.market)
+            self._alert_window.protocol("WM_DELETE_WINDOW", self._alert_window_close)
+
+    def _alert_window_close(self):
+        self._alert_window.destroy()
+        self._alert_window = None
+
+class ScannerWindow(tk.Toplevel):
+    def __init__(self, open_market):
+        tk.Toplevel.__init__(self)
+        self.title("Scanner - " + apptitle)
+        self.resizable(False, True)
+        self.open_market = open_market
+        self.auto_chart = tk.IntVar()
+        self.auto_chart.set(1 if scanner.auto_chart > 0 else 0)
+        tk.Checkbutton(self, text="Chart the top {0} in the background".format(auto_chart_count),
+                       variable=self.auto_chart, command=self._toggle_auto_chart).pack(anchor='w')
+        self.frame = tk.Frame(self)
+        self.frame.pack(expand=1, fill='both')
+        self.after(1000, self._display_watchlist)
+
+    def _toggle_auto_chart(self):
+        scanner.set_auto_chart(auto_chart_count if self.auto_chart.get() else 0)
+
+    def _display_watchlist(self):
+        self.frame.destroy()
+        self.frame = tk.Frame(self)
+        self.frame.pack(expand=1, fill='both')
+        row = 0
+        for column, heading in enumerate(["Market", "Last", "Change", "Volume", "Vol Spike", "Spread"]):
+            tk.Label(self.frame, text=heading).grid(row=row, column=column, padx=10)
+        watchlist = scanner.watchlist
+        for market in watchlist.index:
+            row += 1
+            tk.Button(self.frame, text=market, relief='flat',
+                      command=lambda m=market: self.open_market(m)).grid(row=row, column=0, sticky="w")
+            tk.Label(self.frame, text="{:.8f}".format(watchlist.ix[market, "last"])[:10]).grid(row=row, column=1)
+            tk.Label(self.frame, text="{:.2f}%".format(watchlist.ix[market, "percentChange"] * 100)).grid(row=row, column=2)
+            tk.Label(self.frame, text="{:.2f}".format(watchlist.ix[market, "baseVolume"])).grid(row=row, column=3)
+            tk.Label(self.frame, text="{:.2f}".format(watchlist.ix[market, "spike"])).grid(row=row, column=4)
+            tk.Label(self.frame, text="{:.2f}%".format(watchlist.ix[market, "spread"] * 100)).grid(row=row, column=5)
+        tk.Label(self.frame, text="Scan: {:.1f}ms".format(scanner.scan_time * 1000),
+                 font=SM_MONO).grid(row=row + 1, column=0, columnspan=6, sticky="w")
+        self.after(1000, self._display_watchlist)
+
+
+class AlertWindow(tk.Toplevel):
+    def __init__(self, market):
+        tk.Toplevel.__init__(self)
+        self.resizable(False, False)
+        self.market = market
+        self.title("Alert " + market)
+
+        self.frame = tk.Frame(self)
+        self.frame.pack(fill='both', expand=0)
+
+        tk.Label(self.frame, text="Price:").grid(row=0, column=0, padx=10, pady=10)
+        self.price = tk.Entry(self.frame, width=12, justify='right')
+        self.price.grid(row=0, column=1)
+        self.price.insert(0, '{:.8f}'.format(pdat.ticker.ix[self.market, 'last'])[:10])
+
+        self.field = tk.StringVar()
+        self.field.set('last')
+        tk.Radiobutton(self.frame, text="Last", variable=self.field, value='last').grid(row=1, column=0)
+        tk.Radiobutton(self.frame, text="Bid", variable=self.field, value='highestBid').grid(row=1, column=1)
+        tk.Radiobutton(self.frame, text="Ask", variable=self.field, value='lowestAsk').grid(row=1, column=2)
+
+        self.result_label = tk.Label(self.frame, text="")
+        self.result_label.grid(row=2, column=0, columnspan=2)
+        tk.Button(self.frame, text="Add", command=self._add).grid(row=2, column=2, padx=10, pady=10)
+
+    def _add(self):
+        try:
+            alert = alerts.add(self.market, float(self.price.get()), self.field.get())
+            self.result_label['text'] = alert.direction + " " + self.price.get()
+        except ValueError:
+            self.result_label['text'] = "Bad price"
+
+
 class APIKeyInput(tk.Frame):
     def __init__(self, parent):
         tk.Frame.__init__(self, parent)
@@ -536,7 +778,7 @@ class BuyWindow(tk.Toplevel):
         self.frame.pack(fill='both', expand=0)
 
         tk.Label(self.frame, text="Available:").grid(row=0, column=0, pady=10)
-        self.available = tk.Label(self.frame, width=12, text=pdat.balances[self.market.split('_')[0]]["available"])
+        self.available = tk.Label(self.frame, width=12, text=available_balance(self.market.split('_')[0]))
         self.available.grid(row=0, column=1, sticky='e')
         tk.Label(self.frame, text=self.market.split("_")[0]).grid(row=0, column=2, sticky="w")
 
@@ -601,8 +843,12 @@ class BuyWindow(tk.Toplevel):
         price = self.price.get()
         amount = self.amount.get()
         print("Buy", self.market, price, amount)
-        result = pdat.buy(self.market, price, amount)
-        self.result_label['text'] = result
+        self.result_label['text'] = "Sending..."
+        orders.buy(self.market, price, amount, callback=self._order_done)
+
+    def _order_done(self, order):
+        if self.winfo_exists():
+            self.result_label['text'] = order_result_text(order)
 
 class SellWindow(tk.Toplevel):
     def __init__(self, market):
@@ -620,7 +866,7 @@ class SellWindow(tk.Toplevel):
         self.frame.pack(fill='both', expand=0)
 
         tk.Label(self.frame, text="Available:").grid(row=0, column=0, pady=10)
-        self.available = tk.Label(self.frame, width=12, text=pdat.balances[self.market.split('_')[1]]["available"])
+        self.available = tk.Label(self.frame, width=12, text=available_balance(self.market.split('_')[1]))
         self.available.grid(row=0, column=1, sticky='e')
         tk.Label(self.frame, text=self.market.split("_")[1]).grid(row=0, column=2, sticky="w")
 
@@ -685,9 +931,40 @@ class SellWindow(tk.Toplevel):
         price = self.price.get()
         amount = self.amount.get()
         print("Sell", self.market, price, amount)
-        result = pdat.sell(self.market, price, amount)
-        self.result_label['text'] = result
+        self.result_label['text'] = "Sending..."
+        orders.sell(self.market, price, amount, callback=self._order_done)
+
+    def _order_done(self, order):
+        if self.winfo_exists():
+            self.result_label['text'] = order_result_text(order)
+
+
+def order_result_text(order):
+    if order.error is not None:
+        return order.error
+    return "Order {0} ({1:.0f}ms)".format(order.order_number, order.latency * 1000)
+
+
 
+def account_balances():
+    # in paper mode the balances windows show the paper account, not the exchange
+    if paper is not None:
+        return account.complete_balances()
+    return pdat.balances
+
+
+def available_balance(currency):
+    balances = account_balances()
+    if balances is None or currency not in balances:
+        return "0.00000000"
+    return balances[currency]["available"]
+
+
+def read_watchlist():
+    if not isfile(watchlistfile):
+        return []
+    with open(watchlistfile, 'r') as f:
+        return [line.strip() for line in f if line.strip() != '']
 
 
 # quick and dirty api key input and save WARNING!! Saves as plain text
@@ -712,11 +989,60 @@ else:
         data = api_key + "\n" + api_secret
         f.write(data)
 
-pdat = PoloData(api_key, api_secret)
-pdat.start_ticker(1)
-pdat.start_charts(60, chartpath)
+if "--collector" in sys.argv:
+    # ticker and charts are collected in a separate process and read back through shared memory
+    pdat = SharedPoloData(api_key, api_secret)
+else:
+    pdat = PoloData(api_key, api_secret)
+replay = None
+if "--replay" in sys.argv:
+    # PoloBot.py --replay 2017-06-01 100 BTC_ETH BTC_XMR ... replays the saved charts from that date at 100x
+    args = sys.argv[sys.argv.index("--replay") + 1:]
+    pdat.chart_path = chartpath
+    replay = ReplaySource(pdat, args[2:], datetime.strptime(args[0], "%Y-%m-%d"), speed=float(args[1]))
+    replay.start()
+elif "--collector" in sys.argv:
+    # with --arrow the collector process writes the arrow files, it is where the charts are updated
+    pdat.start_collector(chartpath, arrow_path=chartpath + "arrow/" if "--arrow" in sys.argv else None)
+    pdat.prefetch_charts(read_watchlist())
+else:
+    pdat.start_ticker(1)
+    pdat.start_charts(60, chartpath)
+    # get the watchlist's histories loading in the background before anyone asks for them
+    pdat.prefetch_charts(read_watchlist())
+paper = None
+account = pdat
+if "--paper" in sys.argv:
+    # buy and sell go to a simulated account filled from the live ticker, PoloBot.py --paper 1.0 starts it with 1 BTC
+    args = sys.argv[sys.argv.index("--paper") + 1:]
+    btc = float(args[0]) if len(args) > 0 and not args[0].startswith("--") else 1.0
+    paper = PaperExchange(pdat)
+    paper.start()
+    account = paper.account(btc=btc)
+    orders = OrderPipeline(account)
+    orders.start()
+else:
+    orders = OrderPipeline(pdat)
+# PoloBot.py --autochart 3 keeps charts of the scanner's top 3 loading in the background, the scanner window can
+# also switch it on and off
+auto_chart_count = 3
+auto_chart = 0
+if "--autochart" in sys.argv:
+    args = sys.argv[sys.argv.index("--autochart") + 1:]
+    auto_chart_count = int(args[0]) if len(args) > 0 and not args[0].startswith("--") else 3
+    auto_chart = auto_chart_count
+scanner = MarketScanner(pdat, auto_chart=auto_chart)
+scanner.start()
+alerts = AlertEngine(pdat)
+alerts.start()
+if "--arrow" in sys.argv and "--collector" not in sys.argv:
+    # every chart and the ticker as memory mappable arrow files for notebooks, see arrowexport.py
+    ArrowExport(pdat, chartpath + "arrow/").start()
 if api_secret != "":
     pdat.start_balances(2)
+    pdat.start_orders(5)
+    if paper is None:
+        orders.start()
 
 
 app = MainWindow()
@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+from bisect import bisect_left, bisect_right
+import numpy as np
+
+
+class Alert:
+    def __init__(self, market, field, level, direction, message=None):
+        self.market = market
+        self.field = field
+        self.level = level
+        self.direction = direction
+        self.message = message
+        self.value = None
+        self.fired = None
+
+    def __str__(self):
+        text = "{0} {1} {2} {3:.8f}".format(self.market, self.field, self.direction, self.level)
+        if self.message is not None:
+            text += " - " + self.message
+        return text
+
+
+class AlertEngine:
+    fields = ['last', 'highestBid', 'lowestAsk']
+
+    def __init__(self, pdat):
+        self.pdat = pdat
+        # (market, field, direction) -> sorted levels and the alerts in the same order
+        self._levels = {}
+        self._alerts = {}
+        self._values = {}
+        self._markets = []
+        self._prev = None
+        self._fired = queue.Queue()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.pdat.add_ticker_callback(self.on_ticker)
+
+    def stop(self):
+        self.pdat.remove_ticker_callback(self.on_ticker)
+
+    def add_listener(self, callback):
+        # callback(alert) is run on the thread that saw the crossing, for scripts without a gui
+        self._listeners.append(callback)
+
+    def add(self, market, level, field='last', direction=None, message=None):
+        level = float(level)
+        if direction is None:
+            current = self._current(market, field)
+            direction = 'above' if current is None or level > current else 'below'
+        alert = Alert(market, field, level, direction, message)
+        key = (market, field, direction)
+        with self._lock:
+            levels = self._levels.setdefault(key, [])
+            i = bisect_right(levels, level)
+            levels.insert(i, level)
+            self._alerts.setdefault(key, []).insert(i, alert)
+            if market not in self._markets:
+                self._markets = self._markets + [market]
+                self._prev = None
+        return alert
+
+    def remove(self, alert):
+        key = (alert.market, alert.field, alert.direction)
+        with self._lock:
+            alerts = self._alerts.get(key, [])
+            if alert in alerts:
+                i = alerts.index(alert)
+                del alerts[i]
+                del self._levels[key][i]
+
+    def on_ticker(self, ticker):
+        markets = self._markets
+        if len(markets) == 0:
+            return
+        current = ticker.reindex(markets)[self.fields].values
+        if self._prev is None or self._prev.shape != current.shape:
+            changed = np.argwhere(~np.isnan(current))
+        else:
+            changed = np.argwhere(current != self._prev)
+        self._prev = current
+        # only the prices that moved since the last update are looked at
+        for row, col in changed:
+            self.update(markets[row], self.fields[col], current[row, col])
+
+    def update(self, market, field, value):
+        # also the way in for indicator values, e.g. update("BTC_ETH", "rsi", 71.2)
+        if np.isnan(value):
+            return
+        old = self._values.get((market, field))
+        self._values[(market, field)] = value
+        if old is None or value == old:
+            return
+        fired = []
+        with self._lock:
+            if value > old:
+                key = (market, field, 'above')
+                levels = self._levels.get(key)
+                if levels:
+                    lo = bisect_right(levels, old)
+                    hi = bisect_right(levels, value)
+                    fired = self._take(key, lo, hi)
+            else:
+                key = (market, field, 'below')
+                levels = self._levels.get(key)
+                if levels:
+                    lo = bisect_left(levels, value)
+                    hi = bisect_left(levels, old)
+                    fired = self._take(key, lo, hi)
+        for alert in fired:
+            alert.value = value
+            alert.fired = time.time()
+            self._fired.put(alert)
+            for callback in self._listeners:
+                callback(alert)
+
+    def poll(self):
+        # call from the gui thread, returns the alerts fired since the last call
+        fired = []
+        while True:
+            try:
+                fired.append(self._fired.get_nowait())
+            except queue.Empty:
+                return fired
+
+    def count(self):
+        return sum(len(levels) for levels in self._levels.values())
+
+    def _take(self, key, lo, hi):
+        if lo >= hi:
+            return []
+        fired = self._alerts[key][lo:hi]
+        del self._alerts[key][lo:hi]
+        del self._levels[key][lo:hi]
+        return fired
+
+    def _current(self, market, field):
+        value = self._values.get((market, field))
+        if value is None and self.pdat.ticker is not None and market in self.pdat.ticker.index \
+                and field in self.pdat.ticker.columns:
+            value = float(self.pdat.ticker.ix[market, field])
+        return value
@@ -0,0 +1,76 @@
+import os
+import threading
+from os import makedirs
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+def columns_to_batch(columns):
+    # numeric numpy columns without nulls become arrow arrays over the same memory
+    return pa.RecordBatch.from_arrays([pa.array(values) for values in columns.values()], names=list(columns))
+
+
+def read_arrow(filename):
+    """
+    for notebooks and other processes, e.g. read_arrow(expanduser("~/charts/arrow/BTC_ETH.arrow")).to_pandas()
+    the table is memory mapped, not read in, and the file it maps is never changed underneath it
+    """
+    return pa.ipc.open_file(pa.memory_map(filename)).read_all()
+
+
+class ArrowExport:
+    """
+    keeps an arrow ipc (feather v2) file per market, plus ticker.arrow, in path up to date with pdat
+    files are written next to the old one and swapped in with os.replace, so a reader sees either
+    the old or the new file whole, never one half written
+    a chart's file holds what pdat has in memory, the last chart_retention (14 days by default) as float32,
+    the full history stays in the csv files
+    """
+    def __init__(self, pdat, path):
+        if pa is None:
+            raise ImportError("ArrowExport needs pyarrow, pip3 install pyarrow")
+        self.pdat = pdat
+        self.path = path
+        makedirs(path, exist_ok=True)
+
+    def start(self):
+        self.pdat.add_chart_callback(self.on_chart)
+        self.pdat.add_ticker_callback(self.on_ticker)
+        for market in list(self.pdat.charts):
+            if self.pdat.charts.get(market) is not None:
+                self.export_chart(market)
+
+    def stop(self):
+        self.pdat.remove_ticker_callback(self.on_ticker)
+        self.pdat.remove_chart_callback(self.on_chart)
+
+    def on_chart(self, market, chart_data):
+        self.export_chart(market)
+
+    def on_ticker(self, ticker):
+        columns = self.pdat.ticker_columns()
+        if columns is not None:
+            self._write("ticker", columns_to_batch(columns))
+
+    def chart_batch(self, market):
+        columns = self.pdat.chart_columns(market)
+        if columns is None:
+            return None
+        return columns_to_batch(columns)
+
+    def export_chart(self, market):
+        batch = self.chart_batch(market)
+        if batch is not None:
+            self._write(market, batch)
+
+    def _write(self, name, batch):
+        filename = os.path.join(self.path, name + ".arrow")
+        # charts can arrive from several prefetch threads at once, each gets its own temporary file
+        temp = filename + ".tmp" + str(threading.get_ident())
+        with pa.OSFile(temp, 'wb') as sink:
+            with pa.ipc.new_file(sink, batch.schema) as writer:
+                writer.write_batch(batch)
+        os.replace(temp, filename)
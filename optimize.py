@@ -0,0 +1,112 @@
+import itertools
+import math
+import numbers
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+
+
+class WalkForward:
+    """
+    walk forward optimisation of a BackTest subclass (one with signals(), runs use runfast)
+    grid is a dict of parameter -> values, e.g. {'fastma': range(5, 50, 5), 'slowma': range(20, 200, 20)}
+    valid optionally filters the combinations, e.g. lambda p: p['fastma'] < p['slowma']
+
+    history is cut into rolling windows, parameters are picked on each in-sample window and then tested on the
+    out-of-sample window straight after it, which is the only profit that counts
+    picking is done by successive halving: every candidate runs on a short start of the in-sample window,
+    the best 1/eta go on to a window eta times longer, until the last few run on all of it
+    """
+    def __init__(self, test_cls, data, grid, valid=None, insample=timedelta(days=60), outsample=timedelta(days=14),
+                 step=None, eta=3, rungs=3, candlewidth=5, **kwargs):
+        self.test_cls = test_cls
+        self.data = data
+        names = list(grid)
+        self.candidates = [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+        if valid is not None:
+            self.candidates = [c for c in self.candidates if valid(c)]
+        self.insample = insample
+        self.outsample = outsample
+        self.step = outsample if step is None else step
+        self.eta = eta
+        self.rungs = min(rungs, int(math.ceil(math.log(max(len(self.candidates), 1), eta))))
+        self.candlewidth = candlewidth
+        self.kwargs = kwargs
+
+        self.backtests = 0
+        self.candles = 0
+        self.results = None
+
+    def windows(self):
+        start = self.data.index[0]
+        while start + self.insample + self.outsample <= self.data.index[-1]:
+            yield start, start + self.insample, start + self.insample + self.outsample
+            start += self.step
+
+    def evaluate(self, params, start, end):
+        # the candles before start are only there to warm the indicators up, the strategies' signals
+        # are zero until their longest average is filled, so no trades happen in them
+        # numpy numbers from a grid like np.arange become plain ones, as in ResultStore
+        params = dict((k, v.item() if isinstance(v, np.generic) else v) for k, v in params.items())
+        warmup = timedelta(minutes=self.candlewidth * max([v for v in params.values()
+                                                           if isinstance(v, numbers.Real)
+                                                           and not isinstance(v, bool)] + [0]))
+        data = self.data[start - warmup:end]
+        data = data[data.index < end]
+        kwargs = dict(self.kwargs)
+        kwargs.update(params)
+        test = self.test_cls(data, candlewidth=self.candlewidth, **kwargs)
+        self.backtests += 1
+        self.candles += self._candles(end - start)
+        initialvalue, finalvalue, profit = test.runfast()
+        return profit
+
+    def select(self, start, end):
+        survivors = list(self.candidates)
+        for rung in range(self.rungs + 1):
+            budget = (end - start) * (self.eta ** (rung - self.rungs))
+            scores = np.array([self.evaluate(c, start, start + budget) for c in survivors])
+            scores[np.isnan(scores)] = -np.inf
+            order = np.argsort(-scores, kind='stable')
+            if rung == self.rungs:
+                return survivors[order[0]], scores[order[0]]
+            survivors = [survivors[i] for i in order[:max(1, int(math.ceil(len(survivors) / self.eta)))]]
+
+    def grid(self, start, end):
+        # the exhaustive search, for comparison
+        scores = np.array([self.evaluate(c, start, end) for c in self.candidates])
+        scores[np.isnan(scores)] = -np.inf
+        best = int(np.argmax(scores))
+        return self.candidates[best], scores[best]
+
+    def run(self, method='halving'):
+        self.backtests = 0
+        self.candles = 0
+        select = self.select if method == 'halving' else self.grid
+        rows = []
+        for is_start, oos_start, oos_end in self.windows():
+            params, insample_profit = select(is_start, oos_start)
+            row = {'insample_start': is_start, 'outsample_start': oos_start, 'outsample_end': oos_end,
+                   'insample_profit': insample_profit,
+                   'outsample_profit': self.evaluate(params, oos_start, oos_end)}
+            row.update(params)
+            rows.append(row)
+        self.results = pd.DataFrame(rows)
+        return self.results
+
+    def _candles(self, period):
+        return int(period / timedelta(minutes=self.candlewidth))
+
+    def summary(self):
+        # evaluations are counted in whole in-sample backtests, a run over a third of the window is a third of one
+        windows = self.results.shape[0]
+        oos = self.results["outsample_profit"].values
+        insample = self._candles(self.insample)
+        grid_candles = windows * (len(self.candidates) * insample + self._candles(self.outsample))
+        return {'windows': windows,
+                'outsample_profit': (np.prod(1 + oos / 100) - 1) * 100,
+                'outsample_mean': oos.mean(),
+                'outsample_winning': (oos > 0).mean() * 100,
+                'backtests': self.backtests,
+                'evaluations': self.candles / insample,
+                'grid_evaluations': grid_candles / insample}
@@ -0,0 +1,192 @@
+import queue
+import threading
+import time
+import uuid
+from poloniex import PoloniexError
+
+
+class Order:
+    def __init__(self, action, market, price=None, amount=None, callback=None, parent=None):
+        self.id = uuid.uuid4().hex
+        self.action = action
+        self.market = market
+        self.price = price
+        self.amount = amount
+        self.callback = callback
+        # moves and cancels act on the exchange order of the buy/sell they were made from
+        self.parent = parent
+        self.order_number = None
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.queued = time.time()
+        self.submitted = None
+        self.acked = None
+
+    @property
+    def latency(self):
+        if self.submitted is None or self.acked is None:
+            return None
+        return self.acked - self.submitted
+
+
+class OrderPipeline:
+    def __init__(self, pdat, retries=3, retry_delay=1):
+        self.pdat = pdat
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.orders = {}
+        self._queue = queue.Queue()
+        self._done = queue.Queue()
+        self.active = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._process_orders)
+        self._thread.setDaemon(True)
+        self.active = True
+        self._thread.start()
+
+    def stop(self):
+        self.active = False
+
+    def buy(self, market, price, amount, callback=None):
+        return self.submit(Order('buy', market, price, amount, callback))
+
+    def sell(self, market, price, amount, callback=None):
+        return self.submit(Order('sell', market, price, amount, callback))
+
+    def move(self, order, price, amount=None, callback=None):
+        return self.submit(Order('move', order.market, price, amount, callback, parent=order))
+
+    def cancel(self, order, callback=None):
+        return self.submit(Order('cancel', order.market, callback=callback, parent=order))
+
+    def submit(self, order):
+        # an order is only ever queued once, resubmitting the same one is a no-op
+        if order.id in self.orders:
+            return self.orders[order.id]
+        self.orders[order.id] = order
+        self._queue.put(order)
+        return order
+
+    def in_flight(self):
+        return [o for o in list(self.orders.values()) if o.status in ('queued', 'submitted')]
+
+    def dispatch(self):
+        # call from the gui thread, runs the callbacks of every order finished since the last call
+        while True:
+            try:
+                order = self._done.get_nowait()
+            except queue.Empty:
+                break
+            if order.callback is not None:
+                order.callback(order)
+
+    def _process_orders(self):
+        while self.active:
+            try:
+                order = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            self._send(order)
+            self._done.put(order)
+        print("Orders thread stopped.")
+
+    def _send(self, order):
+        if order.parent is not None and order.parent.order_number is None:
+            order.status = 'failed'
+            order.error = "No open order to " + order.action
+            return
+
+        order.status = 'submitted'
+        order.submitted = time.time()
+        while True:
+            order.attempts += 1
+            try:
+                result = self._call(order)
+            except PoloniexError as e:
+                # the exchange answered and refused the order, retrying won't help
+                order.status = 'failed'
+                order.error = str(e)
+                return
+            except Exception as e:
+                # no answer, the order may or may not have reached the exchange
+                result = self._find_applied(order)
+                if result is None:
+                    if order.attempts > self.retries:
+                        order.status = 'failed'
+                        order.error = str(e)
+                        return
+                    time.sleep(self.retry_delay * 2 ** (order.attempts - 1))
+                    continue
+            self._ack(order, result)
+            return
+
+    def _call(self, order):
+        if order.action == 'buy':
+            return self.pdat.buy(order.market, order.price, order.amount)
+        if order.action == 'sell':
+            return self.pdat.sell(order.market, order.price, order.amount)
+        if order.action == 'move':
+            return self.pdat.move_order(order.parent.order_number, order.price, order.amount)
+        return self.pdat.cancel_order(order.parent.order_number)
+
+    def _ack(self, order, result):
+        order.acked = time.time()
+        order.status = 'done'
+        order.result = result
+        order_number = result.get('orderNumber') if isinstance(result, dict) else None
+        if order.action in ('buy', 'sell'):
+            order.order_number = order_number
+        elif order.action == 'move':
+            order.order_number = order_number
+            order.parent.order_number = order_number
+            order.parent.price = order.price
+            if order.amount is not None:
+                order.parent.amount = order.amount
+        else:
+            order.parent.order_number = None
+        self.pdat.notify_orders()
+
+    def _find_applied(self, order):
+        # look for the effect of an unanswered request before sending it again
+        try:
+            open_orders = self.pdat.open_orders_for(order.market)
+            if order.action in ('buy', 'sell'):
+                trades = self.pdat.trade_history_for(order.market, order.submitted - 5)
+        except Exception:
+            return None
+        known = set(o.order_number for o in list(self.orders.values()))
+        if order.action in ('buy', 'sell'):
+            price = float(order.price)
+            amount = float(order.amount)
+            # a resting order may have partly filled since, so it can show less than was asked for
+            for o in open_orders:
+                if o['orderNumber'] not in known and o['type'] == order.action and \
+                        float(o['rate']) == price and 0 < float(o['amount']) <= amount:
+                    number = o['orderNumber']
+                    return {'orderNumber': number,
+                            'resultingTrades': [t for t in trades if t['orderNumber'] == number]}
+            # an immediateOrCancel order that filled straight away only shows up as trades, every fill
+            # has to be within our limit and together no more than we asked for, or it was someone else's
+            fills = {}
+            for t in trades:
+                if t['orderNumber'] not in known and t['type'] == order.action:
+                    fills.setdefault(t['orderNumber'], []).append(t)
+            for number, fs in fills.items():
+                within = all(float(f['rate']) <= price if order.action == 'buy' else float(f['rate']) >= price
+                             for f in fs)
+                if within and sum(float(f['amount']) for f in fs) <= amount * (1 + 1e-9):
+                    return {'orderNumber': number, 'resultingTrades': fs}
+            return None
+        open_numbers = set(o['orderNumber'] for o in open_orders)
+        if order.parent.order_number in open_numbers:
+            return None
+        if order.action == 'cancel':
+            return {'success': 1}
+        for o in open_orders:
+            if o['orderNumber'] not in known and float(o['rate']) == float(order.price):
+                return {'success': 1, 'orderNumber': o['orderNumber'], 'resultingTrades': {}}
+        return None
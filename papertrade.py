@@ -0,0 +1,285 @@
+import itertools
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import deque
+import numpy as np
+from poloniex import PoloniexError
+
+
+class PaperOrder:
+    def __init__(self, number, account, market, side, price, amount):
+        self.number = number
+        self.account = account
+        self.market = market
+        self.side = side
+        self.price = price
+        self.amount = amount
+        self.placed = time.time()
+
+
+class PaperExchange:
+    """
+    matches the resting orders of any number of PaperAccounts against the live ticker
+    orders wait in price levels per market and side, each level a first in first out queue,
+    so a ticker update only touches the levels the new highestBid/lowestAsk moved through
+    the ticker has no depth, an order fills whole at its own price once the market reaches it
+    """
+    def __init__(self, pdat, maker_fee=0.15, taker_fee=0.25):
+        self.pdat = pdat
+        self.maker_fee = maker_fee
+        self.taker_fee = taker_fee
+        # (market, side) -> sorted prices, and the queue of orders at each price
+        self._levels = {}
+        self._queues = {}
+        self._orders = {}
+        self._markets = []
+        self._prev = None
+        self._numbers = itertools.count(1)
+        self._trade_ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self.fills = 0
+
+    def start(self):
+        self.pdat.add_ticker_callback(self.on_ticker)
+
+    def stop(self):
+        self.pdat.remove_ticker_callback(self.on_ticker)
+
+    def account(self, btc=1.0, **balances):
+        balances["BTC"] = btc
+        return PaperAccount(self, balances)
+
+    def quote(self, market):
+        ticker = self.pdat.ticker
+        return float(ticker.ix[market, 'highestBid']), float(ticker.ix[market, 'lowestAsk'])
+
+    def on_ticker(self, ticker):
+        markets = self._markets
+        if len(markets) == 0:
+            return
+        current = ticker.reindex(markets)[['highestBid', 'lowestAsk']].values.astype(float)
+        if self._prev is None or self._prev.shape != current.shape:
+            changed = np.arange(len(markets))
+        else:
+            changed = np.flatnonzero((current != self._prev).any(axis=1))
+        self._prev = current
+        for row in changed:
+            bid, ask = current[row]
+            if not (np.isnan(bid) or np.isnan(ask)):
+                self.match(markets[row], bid, ask)
+
+    def match(self, market, bid, ask):
+        with self._lock:
+            filled = []
+            # buys rest below the ask and sells above the bid, whatever the new prices reached is filled
+            levels = self._levels.get((market, 'buy'))
+            if levels:
+                filled += self._take((market, 'buy'), bisect_left(levels, ask), len(levels))
+            levels = self._levels.get((market, 'sell'))
+            if levels:
+                filled += self._take((market, 'sell'), 0, bisect_right(levels, bid))
+            for order in filled:
+                del self._orders[order.number]
+                order.account._fill(order, order.price, self.maker_fee)
+            self.fills += len(filled)
+        return filled
+
+    def _add(self, order):
+        key = (order.market, order.side)
+        levels = self._levels.setdefault(key, [])
+        queues = self._queues.setdefault(key, {})
+        if order.price not in queues:
+            levels.insert(bisect_left(levels, order.price), order.price)
+            queues[order.price] = deque()
+        queues[order.price].append(order)
+        self._orders[order.number] = order
+        if order.market not in self._markets:
+            self._markets = self._markets + [order.market]
+            self._prev = None
+
+    def _remove(self, order):
+        key = (order.market, order.side)
+        queue = self._queues[key][order.price]
+        queue.remove(order)
+        if len(queue) == 0:
+            del self._queues[key][order.price]
+            levels = self._levels[key]
+            del levels[bisect_left(levels, order.price)]
+        del self._orders[order.number]
+
+    def _take(self, key, lo, hi):
+        if lo >= hi:
+            return []
+        levels = self._levels[key]
+        queues = self._queues[key]
+        filled = []
+        for price in levels[lo:hi]:
+            filled.extend(queues.pop(price))
+        del levels[lo:hi]
+        return filled
+
+
+class PaperAccount:
+    """
+    stands in for PoloData when trading, buy/sell/move_order/cancel_order answer like the exchange,
+    so OrderPipeline(account) and strategy code run on it unchanged
+    funds for resting orders are held in on_orders until they fill or are cancelled
+    """
+    def __init__(self, exchange, balances):
+        self.exchange = exchange
+        self.balances = balances
+        self.on_orders = {}
+        self.open_orders = {}
+        self.trades = {}
+        # orders are always tracked here, like PoloData once start_orders is running
+        self.orders_active = True
+
+    def buy(self, market, price, amount):
+        return self._place(market, 'buy', float(price), float(amount))
+
+    def sell(self, market, price, amount):
+        return self._place(market, 'sell', float(price), float(amount))
+
+    def _place(self, market, side, price, amount):
+        bid, ask = self.exchange.quote(market)
+        base, coin = market.split("_")
+        with self.exchange._lock:
+            # same choice as PoloData.buy/sell, postOnly if it would rest on the book, immediateOrCancel if not
+            if side == 'buy':
+                take = price >= ask
+                needed, currency = amount * (ask if take else price), base
+            else:
+                take = price <= bid
+                needed, currency = amount, coin
+            if needed > self.balances.get(currency, 0.0) + 1e-12:
+                raise PoloniexError("Not enough " + currency + ".")
+
+            order = PaperOrder(str(next(self.exchange._numbers)), self, market, side, price, amount)
+            if take:
+                trade = self._fill(order, ask if side == 'buy' else bid, self.exchange.taker_fee)
+                return {'orderNumber': order.number, 'resultingTrades': [trade], 'amountUnfilled': '0.00000000'}
+
+            self._hold(currency, needed)
+            self.open_orders[order.number] = order
+            self.exchange._add(order)
+            return {'orderNumber': order.number, 'resultingTrades': []}
+
+    def move_order(self, order_number, price, amount=None):
+        with self.exchange._lock:
+            order = self._open_order(order_number)
+            self.cancel_order(order_number)
+            try:
+                result = self._place(order.market, order.side, float(price),
+                                     order.amount if amount is None else float(amount))
+            except PoloniexError:
+                # a move that can't be placed leaves the old order where it was
+                self._hold(*self._held(order))
+                self.open_orders[order.number] = order
+                self.exchange._add(order)
+                raise
+        return {'success': 1, 'orderNumber': result['orderNumber'],
+                'resultingTrades': {order.market: result['resultingTrades']}}
+
+    def cancel_order(self, order_number):
+        with self.exchange._lock:
+            order = self._open_order(order_number)
+            self.exchange._remove(order)
+            del self.open_orders[order_number]
+            currency, held = self._held(order)
+            self._hold(currency, -held)
+        return {'success': 1, 'amount': "{:.8f}".format(order.amount),
+                'message': "Order #" + order_number + " canceled."}
+
+    def _open_order(self, order_number):
+        order = self.open_orders.get(order_number)
+        if order is None:
+            raise PoloniexError("Invalid order number, or you are not the person who placed the order.")
+        return order
+
+    def _held(self, order):
+        base, coin = order.market.split("_")
+        if order.side == 'buy':
+            return base, order.price * order.amount
+        return coin, order.amount
+
+    def _hold(self, currency, amount):
+        self.balances[currency] = self.balances.get(currency, 0.0) - amount
+        self.on_orders[currency] = self.on_orders.get(currency, 0.0) + amount
+
+    def _fill(self, order, rate, fee):
+        # called with the exchange lock held, fees come off what is received like on poloniex
+        base, coin = order.market.split("_")
+        total = rate * order.amount
+        feemult = 1 - (fee / 100)
+        if order.number in self.open_orders:
+            del self.open_orders[order.number]
+            currency, held = self._held(order)
+            self.on_orders[currency] -= held
+        elif order.side == 'buy':
+            self.balances[base] -= total
+        else:
+            self.balances[coin] -= order.amount
+        if order.side == 'buy':
+            self.balances[coin] = self.balances.get(coin, 0.0) + order.amount * feemult
+        else:
+            self.balances[base] = self.balances.get(base, 0.0) + total * feemult
+
+        trade_id = next(self.exchange._trade_ids)
+        now = time.time()
+        trade = {'globalTradeID': trade_id, 'tradeID': str(trade_id), 'orderNumber': order.number,
+                 'date': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now)), 'time': now,
+                 'type': order.side, 'category': 'exchange',
+                 'rate': "{:.8f}".format(rate), 'amount': "{:.8f}".format(order.amount),
+                 'total': "{:.8f}".format(total), 'fee': "{:.8f}".format(fee / 100)}
+        self.trades.setdefault(order.market, []).append(trade)
+        return trade
+
+    def open_orders_for(self, market):
+        with self.exchange._lock:
+            return [{'orderNumber': o.number, 'type': o.side, 'rate': "{:.8f}".format(o.price),
+                     'amount': "{:.8f}".format(o.amount), 'total': "{:.8f}".format(o.price * o.amount),
+                     'date': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(o.placed)), 'margin': 0}
+                    for o in self.open_orders.values() if o.market == market]
+
+    def trade_history_for(self, market, start):
+        return [t for t in self.trades.get(market, []) if t['time'] >= start]
+
+    def notify_orders(self):
+        pass
+
+    def get_open_orders(self, market):
+        return self.open_orders_for(market)
+
+    def traded_since_start(self, market):
+        # every paper trade is since the account was made
+        traded = 0.0
+        for trade in self.trades.get(market, []):
+            amount = float(trade['amount'])
+            traded += amount * (1 - float(trade['fee'])) if trade['type'] == 'buy' else -amount
+        return traded
+
+    def position(self, market):
+        coin = market.split("_")[1]
+        return self.balances.get(coin, 0.0) + self.on_orders.get(coin, 0.0)
+
+    def complete_balances(self):
+        # the same shape as PoloData.balances (returnCompleteBalances), for the balance and buy/sell windows
+        with self.exchange._lock:
+            return dict((currency, {'available': "{:.8f}".format(self.balances.get(currency, 0.0)),
+                                    'onOrders': "{:.8f}".format(self.on_orders.get(currency, 0.0)),
+                                    'btcValue': "{:.8f}".format(self._btc_value(currency))})
+                        for currency in set(self.balances) | set(self.on_orders))
+
+    def value(self):
+        # everything in btc at the last price
+        return sum(self._btc_value(currency) for currency in set(self.balances) | set(self.on_orders))
+
+    def _btc_value(self, currency):
+        amount = self.balances.get(currency, 0.0) + self.on_orders.get(currency, 0.0)
+        if currency == "BTC":
+            return amount
+        ticker = self.exchange.pdat.ticker
+        if amount == 0 or ticker is None or "BTC_" + currency not in ticker.index:
+            return 0.0
+        return amount * float(ticker.ix["BTC_" + currency, 'last'])
@@ -1,9 +1,19 @@
+import calendar
 import threading
 import time
-from os.path import isfile
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from io import BytesIO
+from os.path import getsize, isfile
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from poloniex import Poloniex
+import requests
+from requests.adapters import HTTPAdapter
+from poloniex import Poloniex, PoloniexError
+
+# returnChartData fields in the order the api sends them, and the saved csv files have them
+CHART_FIELDS = ['high', 'low', 'open', 'close', 'volume', 'quoteVolume', 'weightedAverage']
 
 
 class PoloData:
@@ -16,6 +26,7 @@ class PoloData:
         self.ticker = None
         self.ticker_active = False
         self._ticker_thread = None
+        self._ticker_callbacks = []
 
         self.charts_update_freq = 60
         self.charts_updated = datetime(1970, 1, 1)
@@ -23,14 +34,60 @@ class PoloData:
         self.charts_active = False
         self._charts_thread = None
         self.chart_path = None
-        self._new_chart = False
+        self.chart_retention = timedelta(days=14)
+        self._chart_pages = {}
+        self._chart_lines = {}
+        # charts are refreshed just after a candle closes, every candle while they are on screen
+        # and less often for hidden ones the quieter their market is
+        self.chart_candle = 300
+        self.chart_lag = 5
+        self.chart_visible = {}
+        self._chart_due = {}
+        self._charts_wake = threading.Event()
+        self._chart_callbacks = []
+        self._charts_loading = set()
+        self._charts_removing = set()
+        # a chart that fails to load or update is tried again after chart_retry seconds, doubling each time
+        self.chart_retry = 30
+        self.chart_retry_max = 1800
+        self.chart_errors = {}
+        self.prefetch_time = None
+        # chart downloads reuse keep-alive connections from one pool, enough for the prefetch workers
+        self.public_url = 'https://poloniex.com/public'
+        self.public_timeout = 30
+        self._session = requests.Session()
+        self._session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=8))
+        # poloniex allows about 6 public calls a second, the charts thread and prefetch workers share that
+        self.public_rate = 6
+        self.public_retries = 3
+        self.public_retry_delay = 1
+        self._public_lock = threading.Lock()
+        self._public_next = 0.0
 
         self.balances_update_freq = 1
+        self.balances_idle_freq = 30
+        self._balances_wake = threading.Event()
+        self._last_order_activity = 0
         self.balances_updated = datetime(1970, 1, 1)
         self.balances = None
         self.balances_active = False
         self._balances_thread = None
 
+        self.orders_update_freq = 5
+        self.orders_updated = datetime(1970, 1, 1)
+        self.open_orders = {}
+        self.trades = {}
+        # net amount bought (after fees) less sold per market, from the trades seen since start_orders
+        self.traded = {}
+        self.trade_page = 10000
+        self._orders_by_number = {}
+        self._last_trade_id = 0
+        self._last_trade_time = None
+        self._orders_changed = True
+        self._orders_wake = threading.Event()
+        self.orders_active = False
+        self._orders_thread = None
+
         self.markets = self._get_markets()
 
     def start_ticker(self, update_freq):
@@ -45,13 +102,29 @@ class PoloData:
             # print(datetime.now(), "Ticker Update")
             self._ticker = self._polo.returnTicker()
             self._populate_ticker()
-            self.ticker_updated = datetime.now()
+            self.publish_ticker(self.ticker)
             time.sleep(self.ticker_update_freq)
         print("Ticker thread stopped.")
 
+    def publish_ticker(self, ticker):
+        # also used by sources other than the exchange, e.g. ReplaySource
+        self.ticker = ticker
+        self.ticker_updated = datetime.now()
+        for callback in list(self._ticker_callbacks):
+            callback(self.ticker)
+
     def stop_ticker(self):
         self.ticker_active = False
 
+    def add_ticker_callback(self, callback):
+        # callback(ticker) is run on the ticker thread after every update
+        if callback not in self._ticker_callbacks:
+            self._ticker_callbacks.append(callback)
+
+    def remove_ticker_callback(self, callback):
+        if callback in self._ticker_callbacks:
+            self._ticker_callbacks.remove(callback)
+
     def _get_markets(self):
         ticker = self._polo.returnTicker()
 
@@ -72,9 +145,11 @@ class PoloData:
     def _populate_ticker(self):
         self.ticker = pd.DataFrame.from_dict(self._ticker, orient='index', dtype=float).fillna(0)
 
-    def start_charts(self, update_freq, chart_path):
+    def start_charts(self, update_freq, chart_path, retention=None):
         self.charts_update_freq = update_freq
         self.chart_path = chart_path
+        if retention is not None:
+            self.chart_retention = retention
         self._charts_thread = threading.Thread(target=self._get_charts)
         self._charts_thread.setDaemon(True)
         self.charts_active = True
@@ -83,35 +158,183 @@ class PoloData:
     def _get_charts(self):
         while self.charts_active:
             # print(datetime.now(), "Charts Update")
-            update_time = datetime.now() + timedelta(seconds=self.charts_update_freq)
-            for chart in self.charts:
+            self._charts_wake.clear()
+            self._drop_removed_charts()
+            for chart in list(self.charts):
+                if chart not in self.charts or chart in self._charts_loading or chart in self._charts_removing:
+                    continue
+                if datetime.now() < self._chart_due.get(chart, datetime.now()):
+                    continue
                 market, currency = chart.split("_")
-                if self.charts[chart] is None:
-                    self.charts[chart] = self._load_chart(market, currency,
-                                                          datetime.now() - timedelta(days=90), datetime.now())
-                    self._new_chart = False
-                else:
-                    self.charts[chart] = self._update_chart(market, currency, self.charts[chart])
+                chart_data = self.charts.get(chart)
+                try:
+                    if chart_data is None:
+                        new_data = self._load_chart(market, currency, datetime.now() - timedelta(days=90),
+                                                    datetime.now())
+                    else:
+                        new_data = self._update_chart(market, currency, chart_data)
+                except Exception as e:
+                    self._chart_failed(chart, e)
+                    continue
+                self.chart_errors.pop(chart, None)
+                # remove_chart may have been called while this was loading, don't put the chart back
+                if chart not in self.charts or chart in self._charts_removing:
+                    continue
+                self.charts[chart] = new_data
+                self._chart_due[chart] = self._next_chart_update(chart)
+                if new_data is not chart_data:
+                    self.publish_chart(chart, new_data)
             self.charts_updated = datetime.now()
-            while datetime.now() < update_time and not self._new_chart:
-                time.sleep(1)
+
+            due = [self._chart_due[c] for c in list(self.charts) if c in self._chart_due]
+            wait = self.charts_update_freq
+            if len(due) > 0:
+                wait = min(wait, max(0.0, (min(due) - datetime.now()).total_seconds()))
+            # add_chart and set_chart_visible wake this up early
+            self._charts_wake.wait(wait)
 
         print("Charts thread stopped.")
 
     def stop_charts(self):
         self.charts_active = False
+        self._charts_wake.set()
+
+    def add_chart_callback(self, callback):
+        # callback(market, chart_data) is run on the charts thread whenever a chart is loaded or grows
+        if callback not in self._chart_callbacks:
+            self._chart_callbacks.append(callback)
 
-    def add_chart(self, market):
+    def remove_chart_callback(self, callback):
+        if callback in self._chart_callbacks:
+            self._chart_callbacks.remove(callback)
+
+    def publish_chart(self, market, chart_data):
+        # the charts thread and prefetch call this, and so does ReplaySource as its candles come in
+        for callback in list(self._chart_callbacks):
+            callback(market, chart_data)
+
+    def _next_chart_update(self, chart):
+        if self.chart_visible.get(chart, 0) > 0:
+            candles = 1
+        elif self.ticker is None or chart not in self.ticker.index:
+            candles = 12
+        else:
+            volume_rank = self.ticker["baseVolume"].rank(pct=True)[chart]
+            if volume_rank >= 0.9:
+                candles = 1
+            elif volume_rank >= 0.5:
+                candles = 3
+            else:
+                candles = 12
+        next_candle = (time.time() // self.chart_candle + candles) * self.chart_candle
+        return datetime.fromtimestamp(next_candle + self.chart_lag)
+
+    def add_chart(self, market, visible=True):
+        self._charts_removing.discard(market)
         if market not in self.charts:
             self.charts[market] = None
-            self._new_chart = True
+        if visible:
+            self.set_chart_visible(market, True)
+        self._charts_wake.set()
+
+    def prefetch_charts(self, markets, visible=False, workers=4):
+        # load several charts at once on a pool of threads instead of one by one on the charts thread
+        markets = [m for m in markets if self.charts.get(m) is None and m not in self._charts_loading]
+        for market in markets:
+            self._charts_loading.add(market)
+            self.add_chart(market, visible)
+        thread = threading.Thread(target=self._prefetch, args=(markets, workers))
+        thread.setDaemon(True)
+        thread.start()
+        return thread
+
+    def _prefetch(self, markets, workers):
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(self._prefetch_chart, markets))
+        self.prefetch_time = time.time() - start
+        self._charts_wake.set()
+
+    def _prefetch_chart(self, chart):
+        market, currency = chart.split("_")
+        try:
+            chart_data = self._load_chart(market, currency, datetime.now() - timedelta(days=90), datetime.now())
+            chart_data = self._update_chart(market, currency, chart_data)
+        except Exception as e:
+            # leave it to the charts thread to try again
+            self._chart_failed(chart, e)
+            self._charts_loading.discard(chart)
+            return
+        self.chart_errors.pop(chart, None)
+        if chart in self.charts and chart not in self._charts_removing:
+            self.charts[chart] = chart_data
+            self._chart_due[chart] = self._next_chart_update(chart)
+            self.publish_chart(chart, chart_data)
+        self._charts_loading.discard(chart)
+
+    def _chart_failed(self, chart, error):
+        # a delisted pair or the network being down backs off that one chart, the others carry on
+        failures = self.chart_errors.get(chart, (0, None))[0] + 1
+        self.chart_errors[chart] = (failures, error)
+        delay = min(self.chart_retry * 2 ** (failures - 1), self.chart_retry_max)
+        self._chart_due[chart] = datetime.now() + timedelta(seconds=delay)
+        print("Chart failed:", chart, error, "retrying in {0}s".format(delay))
+
+    def set_chart_visible(self, market, visible):
+        count = self.chart_visible.get(market, 0) + (1 if visible else -1)
+        self.chart_visible[market] = max(count, 0)
+        if visible:
+            # bring a hidden chart up to date straight away
+            self._chart_due[market] = datetime.now()
+            self._charts_wake.set()
 
     def remove_chart(self, market):
+        # while the charts thread runs it does the removing itself, between loads, so a chart it is
+        # part way through loading is never put back or pulled out from under it
         if market is not None:
-            del self.charts[market]
+            self._charts_removing.add(market)
+            if self.charts_active:
+                self._charts_wake.set()
+            else:
+                self._drop_removed_charts()
+
+    def _drop_removed_charts(self):
+        for market in list(self._charts_removing):
+            self._charts_removing.discard(market)
+            self.charts.pop(market, None)
+            self._chart_pages.pop(market, None)
+            self._chart_due.pop(market, None)
+            self.chart_errors.pop(market, None)
+            self.chart_visible.pop(market, None)
 
-    def start_balances(self, update_freq):
+    def get_chart(self, market, start=None):
+        # only the last chart_retention of each chart is kept in memory,
+        # anything older than that is paged in from the csv on disk
+        chart_data = self.charts.get(market)
+        if chart_data is None or start is None or start >= chart_data.index[0]:
+            return chart_data
+        first = chart_data.index[0]
+        page_start, page_end, page = self._chart_pages.get(market, (None, None, None))
+        if page is None or start < page_start:
+            page_start, page = start, self._read_chart(market, start, first)
+        elif first > page_end:
+            # retention has trimmed the front of the chart since the page was read, the candles in between
+            # are only on disk now
+            gap = self._read_chart(market, page_end, first)
+            if gap.shape[0] > 0:
+                page = pd.concat([page[page.index < page_end], gap]) if page.shape[0] > 0 else gap
+        self._chart_pages[market] = (page_start, first, page)
+        if page.shape[0] == 0:
+            return chart_data
+        page = page[start:]
+        return pd.concat([page[page.index < first], chart_data])
+
+    def release_history(self, market):
+        self._chart_pages.pop(market, None)
+
+    def start_balances(self, update_freq, idle_freq=30):
         self.balances_update_freq = update_freq
+        self.balances_idle_freq = idle_freq
         self._balances_thread = threading.Thread(target=self._get_balances)
         self._balances_thread.setDaemon(True)
         self.balances_active = True
@@ -120,26 +343,198 @@ class PoloData:
     def _get_balances(self):
         while self.balances_active:
             # print(datetime.now(), "Balances Update")
+            self._balances_wake.clear()
             self.balances = self._polo.returnCompleteBalances()
             self.balances_updated = datetime.now()
-            time.sleep(self.balances_update_freq)
+            # poll quickly only while orders are open or were just placed, notify_orders wakes us early
+            self._balances_wake.wait(self.balances_update_freq if self._orders_busy() else self.balances_idle_freq)
         print("Balances thread stopped.")
 
     def stop_balances(self):
         self.balances_active = False
+        self._balances_wake.set()
+
+    def start_orders(self, update_freq, history_days=30):
+        self.orders_update_freq = update_freq
+        self._last_trade_time = int(time.time()) - history_days * 86400
+        self._orders_thread = threading.Thread(target=self._get_orders)
+        self._orders_thread.setDaemon(True)
+        self.orders_active = True
+        self._orders_thread.start()
+
+    def _get_orders(self):
+        full_sync = 0
+        while self.orders_active:
+            # print(datetime.now(), "Orders Update")
+            self._orders_wake.clear()
+            new_trades = self._sync_trades()
+            # open orders can't be fetched incrementally, so only ask again when something changed
+            if new_trades or self._orders_changed or time.time() > full_sync:
+                self._orders_changed = False
+                self._sync_open_orders()
+                full_sync = time.time() + 60
+            self.orders_updated = datetime.now()
+            self._orders_wake.wait(self.orders_update_freq if self._orders_busy() else self.balances_idle_freq)
+        print("Orders thread stopped.")
+
+    def stop_orders(self):
+        self.orders_active = False
+        self._orders_wake.set()
+
+    def _orders_busy(self):
+        return len(self.open_orders) > 0 or time.time() - self._last_order_activity < self.balances_idle_freq
+
+    def notify_orders(self):
+        self._orders_changed = True
+        self._last_order_activity = time.time()
+        self._balances_wake.set()
+        self._orders_wake.set()
+
+    def _sync_trades(self):
+        # ask only for trades since the newest one already seen, the overlap is dropped by trade id
+        # a reply holds at most trade_page trades, newest first, so a full one means paging back for the rest
+        new_trades = {}
+        end = int(time.time()) + 60
+        while True:
+            history = self._polo.returnTradeHistory('all', start=self._last_trade_time, end=end,
+                                                    limit=self.trade_page)
+            if not isinstance(history, dict):
+                break
+            count = 0
+            oldest = end
+            for market in history:
+                for trade in history[market]:
+                    count += 1
+                    oldest = min(oldest, self._trade_time(trade))
+                    if int(trade['globalTradeID']) > self._last_trade_id:
+                        trade['market'] = market
+                        new_trades[int(trade['globalTradeID'])] = trade
+            if count < self.trade_page or oldest <= self._last_trade_time:
+                break
+            # the next page ends where this one did, a second full of trades is stepped over rather than looped on
+            end = oldest if oldest < end else end - 1
+        new_trades = [new_trades[trade_id] for trade_id in sorted(new_trades)]
+
+        for trade in new_trades:
+            market = trade['market']
+            amount = float(trade['amount'])
+            if trade['type'] == 'buy':
+                amount *= 1 - float(trade['fee'])
+            else:
+                amount = -amount
+            self.traded[market] = self.traded.get(market, 0.0) + amount
+            self.trades.setdefault(market, []).append(trade)
+            self._last_trade_id = int(trade['globalTradeID'])
+            self._last_trade_time = self._trade_time(trade)
+        return len(new_trades)
+
+    @staticmethod
+    def _trade_time(trade):
+        return calendar.timegm(time.strptime(trade['date'], "%Y-%m-%d %H:%M:%S"))
+
+    def _sync_open_orders(self):
+        raw_orders = self._polo.returnOpenOrders('all')
+        open_orders = {}
+        orders_by_number = {}
+        for market in raw_orders:
+            if len(raw_orders[market]) > 0:
+                open_orders[market] = {}
+                for order in raw_orders[market]:
+                    order['market'] = market
+                    open_orders[market][order['orderNumber']] = order
+                    orders_by_number[order['orderNumber']] = order
+        self.open_orders = open_orders
+        self._orders_by_number = orders_by_number
+
+    def position(self, market):
+        # all of the market's coin held, available and on orders, as of the last balances update
+        coin = market.split("_")[1]
+        balances = self.balances
+        if balances is None or coin not in balances:
+            return 0.0
+        return float(balances[coin]['available']) + float(balances[coin]['onOrders'])
+
+    def traded_since_start(self, market):
+        # net amount of the market's coin bought (after fees) less sold since start_orders, e.g. what a
+        # strategy has added to the position, unlike position() which is everything held
+        return self.traded.get(market, 0.0)
+
+    def get_open_orders(self, market):
+        return list(self.open_orders.get(market, {}).values())
+
+    def get_order(self, order_number):
+        return self._orders_by_number.get(order_number)
+
+    def get_trades(self, market):
+        return self.trades.get(market, [])
 
     def _retrieve_chart_data(self, market, currency, start_date, end_date, freq=300):
-        start_date = start_date.timestamp()
-        end_date = end_date.timestamp()
-
-        raw_chart_data = self._polo.returnChartData(market + "_" + currency, freq, start_date, end_date)
-        chart_data = pd.DataFrame(raw_chart_data, dtype=float)
-        chart_data["Date"] = [datetime.fromtimestamp(d) for d in chart_data["date"]]
-        chart_data.set_index(["Date"], inplace=True)
-        chart_data.drop("date", axis=1, inplace=True)
-        chart_data = chart_data.drop_duplicates()
-        freq_str = str(int(freq / 60)) + "Min"
-        chart_data = chart_data.asfreq(freq_str, method='pad')
+        raw_chart_data = self._public('returnChartData', currencyPair=market + "_" + currency, period=freq,
+                                      start=int(start_date.timestamp()), end=int(end_date.timestamp()))
+        if isinstance(raw_chart_data, dict):
+            raise PoloniexError(raw_chart_data.get('error', raw_chart_data))
+        # the reply ends with the candle still forming, kept it would be stored as it was at this moment,
+        # and a request with no candles in it gets a single one dated 0
+        now = time.time()
+        while len(raw_chart_data) > 0 and (raw_chart_data[-1]['date'] + freq > now or raw_chart_data[-1]['date'] == 0):
+            raw_chart_data.pop()
+        return self._decode_chart_data(raw_chart_data, freq)
+
+    def _public(self, command, **params):
+        params['command'] = command
+        attempt = 0
+        while True:
+            with self._public_lock:
+                wait = self._public_next - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                self._public_next = time.time() + 1 / self.public_rate
+            try:
+                response = self._session.get(self.public_url, params=params, timeout=self.public_timeout)
+                response.raise_for_status()
+                return response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                attempt += 1
+                if attempt > self.public_retries:
+                    raise
+                print("Retrying", command, e)
+                time.sleep(self.public_retry_delay * 2 ** (attempt - 1))
+
+    @staticmethod
+    def _decode_chart_data(raw_chart_data, freq=300):
+        # each field goes straight from the parsed json into its row of one preallocated array,
+        # which becomes the DataFrame without another copy
+        rows = len(raw_chart_data)
+        dates = np.fromiter(map(itemgetter('date'), raw_chart_data), dtype=np.int64, count=rows)
+        values = np.empty((len(CHART_FIELDS), rows))
+        for i, field in enumerate(CHART_FIELDS):
+            values[i] = np.fromiter(map(itemgetter(field), raw_chart_data), dtype=float, count=rows)
+
+        if rows > 0:
+            # one slot per candle, a repeated candle keeps its last copy and a missing one the candle before
+            slots = (dates - dates[0]) // freq
+            filled = np.full(slots[-1] + 1, -1)
+            filled[slots] = np.arange(rows)
+            filled = np.maximum.accumulate(filled)
+            values = values[:, filled]
+            dates = dates[0] + np.arange(filled.shape[0]) * freq
+
+        # local wall clock times, the same as datetime.fromtimestamp gives, with the utc offset looked up
+        # once an hour rather than once a candle, and candle by candle only in the hours it changes
+        if rows > 0:
+            hours = np.arange(dates[0] // 3600, dates[-1] // 3600 + 2)
+            offsets = np.array([time.localtime(h * 3600).tm_gmtoff for h in hours.tolist()], dtype=np.int64)
+            hour = dates // 3600 - hours[0]
+            local = offsets[hour]
+            for i in np.flatnonzero(np.isin(hour, np.flatnonzero(np.diff(offsets)))):
+                local[i] = time.localtime(dates[i]).tm_gmtoff
+            dates = dates + local
+        index = pd.DatetimeIndex(dates.astype('datetime64[s]'), name="Date")
+        chart_data = pd.DataFrame(values.T, index=index, columns=CHART_FIELDS)
+        # when the clocks go back an hour of local times comes round twice, only the first is kept
+        # so the index stays unique for asfreq
+        if not index.is_unique:
+            chart_data = chart_data[~index.duplicated(keep='first')]
         return chart_data
 
     def _load_chart(self, market, currency, start_date, end_date, freq=300, force_reload=False):
@@ -152,21 +547,96 @@ class PoloData:
             # print("Downloading:", market + "_" + currency)
             chart_data = self._retrieve_chart_data(market, currency, start_date, end_date, freq)
             chart_data.to_csv(path)
-        return chart_data
+            self._chart_lines.pop(path, None)
+        return self._compact_chart(chart_data, self.chart_retention)
 
     def _update_chart(self, market, currency, chart_data, freq=300):
         path = self.chart_path + market + "_" + currency + ".csv"
+        last_entry = chart_data.index[-1]
         next_entry = chart_data.ix[-1].name.to_pydatetime() + timedelta(minutes=int(freq / 60))
         update = self._retrieve_chart_data(market, currency, next_entry, datetime.now(), freq)
+        update = update[update.index > last_entry]
         # print("Updating:", market + "_" + currency)
-        if update.shape[0] > 1:
+        if update.shape[0] > 0:
             chart_data = pd.concat([chart_data, update])
-            chart_data = chart_data.drop_duplicates()
+            chart_data = chart_data[~chart_data.index.duplicated(keep='first')].sort_index()
             freq_str = str(int(freq / 60)) + "Min"
             chart_data = chart_data.asfreq(freq_str, method='pad')
-            chart_data.to_csv(path)
+            # append just the new candles, the csv holds history that is no longer in memory
+            chart_data[chart_data.index > last_entry].to_csv(path, mode='a', header=False)
+            chart_data = self._compact_chart(chart_data, self.chart_retention)
         return chart_data
 
+    def _read_chart(self, market, start, end):
+        # only the lines between start and end are read and parsed, found from an index of where each line
+        # starts in the csv
+        path = self.chart_path + market + ".csv"
+        if not isfile(path):
+            return pd.DataFrame()
+        columns, dates, offsets = self._index_chart_lines(path)
+        lo = 0 if start is None else np.searchsorted(dates, start.strftime("%Y-%m-%d %H:%M:%S").encode(), 'left')
+        hi = len(dates) if end is None else np.searchsorted(dates, end.strftime("%Y-%m-%d %H:%M:%S").encode(),
+                                                            'right')
+        if lo >= hi:
+            return pd.DataFrame()
+        with open(path, 'rb') as f:
+            f.seek(offsets[lo])
+            lines = f.read(offsets[hi] - offsets[lo])
+        chart_data = pd.read_csv(BytesIO(lines), header=None, names=columns, parse_dates=True, index_col="Date")
+        return self._compact_chart(chart_data, None)
+
+    def _index_chart_lines(self, path):
+        # the csv is only ever appended to, so just what was added since the last look is scanned,
+        # each line starts with its date in a format that sorts the same as the times do
+        size = getsize(path)
+        columns, dates, offsets = self._chart_lines.get(path, (None, None, None))
+        if columns is None or size < offsets[-1]:
+            with open(path, 'rb') as f:
+                header = f.readline()
+            columns = header.decode().strip().split(",")
+            dates = np.array([], dtype='S19')
+            offsets = np.array([len(header)], dtype=np.int64)
+        if size > offsets[-1]:
+            with open(path, 'rb') as f:
+                f.seek(offsets[-1])
+                added = f.read(size - offsets[-1])
+            added = added[:added.rfind(b"\n") + 1]
+            ends = np.flatnonzero(np.frombuffer(added, dtype=np.uint8) == ord("\n")) + 1
+            if ends.shape[0] > 0:
+                starts = np.concatenate([[0], ends[:-1]])
+                raw = np.frombuffer(added.ljust(len(added) + 19), dtype=np.uint8)
+                new_dates = raw[starts[:, None] + np.arange(19)].copy().view('S19').ravel()
+                dates = np.concatenate([dates, new_dates])
+                offsets = np.concatenate([offsets, offsets[-1] + ends])
+        self._chart_lines[path] = (columns, dates, offsets)
+        return columns, dates, offsets
+
+    def chart_columns(self, market):
+        # the chart as a dict of numpy columns that share memory with it, nothing is copied,
+        # so they can be wrapped as arrow arrays (see arrowexport.py) or handed to anything else columnar
+        # this is only what is in memory, the last chart_retention as float32, older candles are in the csv
+        chart_data = self.charts.get(market)
+        if chart_data is None:
+            return None
+        columns = {"Date": chart_data.index.values}
+        for name in chart_data.columns:
+            columns[name] = chart_data[name].values
+        return columns
+
+    def ticker_columns(self):
+        ticker = self.ticker
+        if ticker is None:
+            return None
+        columns = {"market": ticker.index.values}
+        for name in ticker.columns:
+            columns[name] = ticker[name].values
+        return columns
+
+    def _compact_chart(self, chart_data, retention):
+        if retention is not None and chart_data.shape[0] > 0:
+            chart_data = chart_data[chart_data.index[-1] - retention:]
+        return chart_data.astype(np.float32)
+
     def calculate_macd(self, closes, ema_fast, ema_slow, ema_signal):
         ema_fast = closes.ewm(ema_fast).mean()
         ema_slow = closes.ewm(ema_slow).mean()
@@ -202,9 +672,29 @@ class PoloData:
 
         return result
 
+    def move_order(self, order_number, price, amount=None):
+        if amount is None:
+            result = self._polo.moveOrder(order_number, price)
+        else:
+            result = self._polo.moveOrder(order_number, price, amount)
+
+        return result
+
+    def cancel_order(self, order_number):
+        result = self._polo.cancelOrder(order_number)
+
+        return result
+
+    def open_orders_for(self, market):
+        return self._polo.returnOpenOrders(market)
+
+    def trade_history_for(self, market, start):
+        return self._polo.returnTradeHistory(market, start)
+
 class BackTest:
     def __init__(self, data, tradepct=10, btcbalance=0.01, coinbalance=0.0,
-                 buyfee=0.25, sellfee=0.15, candlewidth=5, **kwargs):
+                 buyfee=0.25, sellfee=0.15, candlewidth=5,
+                 stoploss=None, takeprofit=None, trailingstop=None, **kwargs):
         self.data = data.asfreq(str(candlewidth) + 'Min', method='pad')
         self.startbtcbalance = btcbalance
         self.startcoinbalance = coinbalance
@@ -214,8 +704,17 @@ class BackTest:
         self.tradesizebtc = self.btcbalance * (self.tradepct / 100)
         self.buyfeemult = 1 - (buyfee / 100)
         self.sellfeemult = 1 - (sellfee / 100)
+        # stops and targets are percentages from the price the position was opened at
+        # (trailing stop from the highest high since), None to switch off
+        self.stoploss = stoploss
+        self.takeprofit = takeprofit
+        self.trailingstop = trailingstop
+        self.entryprice = None
+        self.peakprice = None
+        self.changes = []
         self.step = 0
         self.testlength = self.data.shape[0]
+        self.kwargs = kwargs
         self.addindicators(**kwargs)
 
     def addindicators(self, **kwargs):
@@ -227,11 +726,63 @@ class BackTest:
         """
         pass
 
+    @classmethod
+    def signals(cls, closes, **kwargs):
+        """
+        override this with a vectorised version of dostep, used by PortfolioBackTest
+        closes is a DataFrame with one column per market (or a single Series),
+        return the same shape with 1 for buy, -1 for sell and 0 for nothing
+        for example
+        ma = closes.rolling(kwargs["ma"]).mean()
+        return cls._crossings(closes, ma, kwargs["ma"])
+        """
+        raise NotImplementedError(cls.__name__ + " has no vectorised signals")
+
+    @staticmethod
+    def _crossings(fast, slow, warmup):
+        prevfast = fast.shift(1)
+        prevslow = slow.shift(1)
+        buys = (fast > slow) & (prevfast < prevslow)
+        sells = (fast < slow) & (prevfast > prevslow)
+        signal = buys.astype(int) - sells.astype(int)
+        signal.iloc[:warmup + 1] = 0
+        return signal
+
     def _dostep(self):
         self.tradesizebtc = self.btcbalance * (self.tradepct / 100)
+        if self.entryprice is not None:
+            self._checkexits()
         self.dostep()
         self.step += 1
 
+    def _stoplevel(self, peakprice):
+        level = -np.inf
+        if self.stoploss is not None:
+            level = self.entryprice * (1 - (self.stoploss / 100))
+        if self.trailingstop is not None:
+            level = np.maximum(level, peakprice * (1 - (self.trailingstop / 100)))
+        return level
+
+    def _targetlevel(self):
+        if self.takeprofit is None:
+            return np.inf
+        return self.entryprice * (1 + (self.takeprofit / 100))
+
+    def _checkexits(self):
+        # a candle that touches both the stop and the target is treated as stopped out,
+        # a candle that opens beyond a level fills at the open
+        open = self.data.ix[self.step, "open"]
+        high = self.data.ix[self.step, "high"]
+        low = self.data.ix[self.step, "low"]
+        stop = self._stoplevel(self.peakprice)
+        target = self._targetlevel()
+        if low <= stop:
+            self.sell(min(open, stop))
+        elif high >= target:
+            self.sell(max(open, target))
+        else:
+            self.peakprice = max(self.peakprice, high)
+
     def dostep(self):
         """
         Override this with code to add your own strategy code
@@ -251,18 +802,111 @@ class BackTest:
         if self.btcbalance > self.tradesizebtc:
             self.btcbalance -= self.tradesizebtc
             self.coinbalance += ((self.tradesizebtc / price) * self.buyfeemult)
+            if self.entryprice is None:
+                self.entryprice = price
+                self.peakprice = price
+            self.changes.append((self.step, self.btcbalance, self.coinbalance))
             # print("Step:{0} Bought at {1:.8f}".format(self.step, price))
 
     def sell(self, price):
         if self.coinbalance > 0:
             self.btcbalance += ((self.coinbalance * price) * self.sellfeemult)
             self.coinbalance = 0.0
+            self.entryprice = None
+            self.peakprice = None
+            self.changes.append((self.step, self.btcbalance, self.coinbalance))
             # print("Step:{0} Sold at {1:.8f}".format(self.step, price))
 
     def runtest(self):
         for i in range(self.testlength):
             self._dostep()
 
+        return self._result()
+
+    def runfast(self):
+        """
+        array based equivalent of runtest for strategies that implement signals()
+        stops and targets are found by scanning the high/low arrays from each entry
+        so the python loop only runs once per trade instead of once per candle
+        """
+        signal = np.asarray(self.signals(self.data["close"], **self.kwargs))
+        opens = self.data["open"].values
+        highs = self.data["high"].values
+        lows = self.data["low"].values
+        closes = self.data["close"].values
+        buysteps = np.flatnonzero(signal > 0)
+
+        step = 0
+        while step < self.testlength:
+            nextbuy = np.searchsorted(buysteps, step)
+            if nextbuy == buysteps.shape[0]:
+                break
+            self.step = buysteps[nextbuy]
+            self.tradesizebtc = self.btcbalance * (self.tradepct / 100)
+            self.buy(closes[self.step])
+            if self.entryprice is None:
+                step = self.step + 1
+                continue
+
+            entrystep = self.step
+            exitstep, exitprice = self._findexit(entrystep, signal, opens, highs, lows, closes)
+
+            # further buys before the exit add to the position without moving the stops
+            for buystep in buysteps[nextbuy + 1:np.searchsorted(buysteps, exitstep)]:
+                self.step = buystep
+                self.tradesizebtc = self.btcbalance * (self.tradepct / 100)
+                self.buy(closes[self.step])
+
+            if exitprice is None:
+                break
+            self.step = exitstep
+            self.sell(exitprice)
+            # a stop hit intrabar still leaves that candle's close free for a new entry
+            step = exitstep
+
+        self.step = self.testlength
+        return self._result()
+
+    def _findexit(self, entrystep, signal, opens, highs, lows, closes):
+        peakprice = self.peakprice
+        target = self._targetlevel()
+        start = entrystep + 1
+        size = 256
+        while start < self.testlength:
+            end = min(self.testlength, start + size)
+            high = highs[start:end]
+            low = lows[start:end]
+            peaks = np.maximum.accumulate(np.concatenate(([peakprice], high[:-1])))
+            stop = self._stoplevel(peaks) * np.ones(end - start)
+            hitstop = low <= stop
+            hittarget = high >= target
+            hits = hitstop | hittarget | (signal[start:end] < 0)
+            if hits.any():
+                i = int(np.argmax(hits))
+                if hitstop[i]:
+                    return start + i, min(opens[start + i], stop[i])
+                if hittarget[i]:
+                    return start + i, max(opens[start + i], target)
+                return start + i, closes[start + i]
+            peakprice = max(peakprice, high.max())
+            start = end
+            size *= 2
+        return self.testlength, None
+
+    def equitycurve(self):
+        # value in btc at every close, rebuilt from the balance changes so it works after runtest or runfast
+        btc = np.full(self.testlength, np.nan)
+        coin = np.full(self.testlength, np.nan)
+        btc[0] = self.startbtcbalance
+        coin[0] = self.startcoinbalance
+        for step, btcbalance, coinbalance in self.changes:
+            btc[step] = btcbalance
+            coin[step] = coinbalance
+        btc = pd.Series(btc).ffill().values
+        coin = pd.Series(coin).ffill().values
+        return btc + coin * self.data["close"].values
+
+    def _result(self):
         finalvalue = self.btcbalance + (self.coinbalance * self.data.ix[self.testlength - 1, "close"])
         initialvalue = self.startbtcbalance + (self.startcoinbalance * self.data.ix[0, "close"])
         profit = ((finalvalue - initialvalue) / initialvalue) * 100
@@ -276,6 +920,12 @@ class SMACrossoverBackTest(BackTest):
         self.data["fastma"] = self.data["close"].rolling(self.fastma).mean()
         self.data["slowma"] = self.data["close"].rolling(self.slowma).mean()
 
+    @classmethod
+    def signals(cls, closes, **kwargs):
+        fastma = closes.rolling(kwargs["fastma"]).mean()
+        slowma = closes.rolling(kwargs["slowma"]).mean()
+        return cls._crossings(fastma, slowma, kwargs["slowma"])
+
     def dostep(self):
         if self.step > self.slowma:
             prevfastma = self.data.ix[self.step - 1, "fastma"]
@@ -298,6 +948,12 @@ class EMACrossoverBackTest(BackTest):
         self.data["fastma"] = self.data["close"].ewm(self.fastma).mean()
         self.data["slowma"] = self.data["close"].ewm(self.slowma).mean()
 
+    @classmethod
+    def signals(cls, closes, **kwargs):
+        fastma = closes.ewm(kwargs["fastma"]).mean()
+        slowma = closes.ewm(kwargs["slowma"]).mean()
+        return cls._crossings(fastma, slowma, kwargs["slowma"])
+
     def dostep(self):
         if self.step > self.slowma:
             prevfastma = self.data.ix[self.step - 1, "fastma"]
@@ -318,6 +974,11 @@ class PriceCrossSMABackTest(BackTest):
         self.ma = kwargs["ma"]
         self.data["ma"] = self.data["close"].rolling(self.ma).mean()
 
+    @classmethod
+    def signals(cls, closes, **kwargs):
+        ma = closes.rolling(kwargs["ma"]).mean()
+        return cls._crossings(closes, ma, kwargs["ma"])
+
     def dostep(self):
         if self.step > self.ma:
             prevprice = self.data.ix[self.step - 1, "close"]
@@ -330,6 +991,66 @@ class PriceCrossSMABackTest(BackTest):
             elif price < ma and prevprice > prevma:
                 self.sell(price)
 
+
+class PortfolioBackTest:
+    def __init__(self, charts, strategy, tradepct=10, btcbalance=0.01,
+                 buyfee=0.25, sellfee=0.15, candlewidth=5, **kwargs):
+        """
+        charts is a dict of market -> candle DataFrame (as held in PoloData.charts)
+        strategy is a BackTest subclass implementing signals(), kwargs are passed to it
+        all markets trade from one shared btc balance
+        """
+        freq = str(candlewidth) + 'Min'
+        closes = {}
+        for market in charts:
+            closes[market] = charts[market]["close"].asfreq(freq, method='pad')
+        self.closes = pd.concat(closes, axis=1)
+        self.markets = list(self.closes.columns)
+        self.strategy = strategy
+        self.startbtcbalance = btcbalance
+        self.btcbalance = btcbalance
+        self.coinbalances = np.zeros(len(self.markets))
+        self.tradepct = tradepct
+        self.buyfeemult = 1 - (buyfee / 100)
+        self.sellfeemult = 1 - (sellfee / 100)
+        self.trades = 0
+        self.testlength = self.closes.shape[0]
+        self.kwargs = kwargs
+
+    def runtest(self):
+        signals = self.strategy.signals(self.closes, **self.kwargs).values
+        prices = self.closes.values
+        keep = 1 - (self.tradepct / 100)
+
+        # only candles where at least one market signals can change the balances
+        for step in np.flatnonzero((signals != 0).any(axis=1)):
+            signal = signals[step]
+            price = prices[step]
+
+            sells = (signal < 0) & (self.coinbalances > 0)
+            if sells.any():
+                self.btcbalance += (self.coinbalances[sells] * price[sells]).sum() * self.sellfeemult
+                self.coinbalances[sells] = 0.0
+                self.trades += int(sells.sum())
+
+            buys = np.flatnonzero(signal > 0)
+            if buys.shape[0] > 0 and 0 < keep < 1 and self.btcbalance > 0:
+                # buys are taken in column order, each one tradepct of what is left
+                sizes = self.btcbalance * (1 - keep) * keep ** np.arange(buys.shape[0])
+                self.coinbalances[buys] += (sizes / price[buys]) * self.buyfeemult
+                self.btcbalance -= sizes.sum()
+                self.trades += buys.shape[0]
+
+        lastprices = self.closes.ffill().values[-1]
+        held = self.coinbalances > 0
+        finalvalue = self.btcbalance + (self.coinbalances[held] * lastprices[held]).sum()
+        initialvalue = self.startbtcbalance
+        profit = ((finalvalue - initialvalue) / initialvalue) * 100
+        return initialvalue, finalvalue, profit
+
+    def holdings(self):
+        return pd.Series(self.coinbalances, index=self.markets)
+
 # # Test Simple Moving Average Crossover
 # for fastma in range(5, 50, 5):
 #     slowma = fastma * 4
@@ -347,6 +1068,31 @@ class PriceCrossSMABackTest(BackTest):
 #         test = EMACrossoverBackTest(portfolio.chartdata[coin], fastma=fastma, slowma=slowma)
 #         initialvalue, finalvalue, profit = test.runtest()
 #         print("{0}: Profit {1:.2f}%".format(coin, profit))
+#
+# # Test SMA Crossover across the whole portfolio with a shared btc balance
+# test = PortfolioBackTest(portfolio.chartdata, SMACrossoverBackTest, fastma=10, slowma=40)
+# initialvalue, finalvalue, profit = test.runtest()
+# print("Portfolio: Profit {0:.2f}%".format(profit))
+#
+# # Same sweep, but runs already in the result store are skipped (see resultstore.py)
+# store = ResultStore(expanduser("~/charts/results.db"))
+# for fastma in range(5, 50, 5):
+#     for coin in portfolio.currencies:
+#         store.runtest(SMACrossoverBackTest, portfolio.chartdata[coin], "BTC_" + coin, fast=True,
+#                       fastma=fastma, slowma=fastma * 4)
+# for market, params, profit, drawdown, key in store.best(SMACrossoverBackTest):
+#     print("{0}: Fast:{1} Slow:{2} Profit {3:.2f}%".format(market, params["fastma"], params["slowma"], profit))
+#
+# # How much of that profit is luck? 10,000 resampled price paths (see robustness.py)
+# mc = MonteCarlo(SMACrossoverBackTest, portfolio.chartdata["XMR"], npaths=10000, fastma=10, slowma=40)
+# mc.run()
+# print(mc.summary())
+#
+# # Pick fastma/slowma on rolling 60 day windows and test each pick on the 14 days after (see optimize.py)
+# wf = WalkForward(SMACrossoverBackTest, portfolio.chartdata["XMR"],
+#                  {'fastma': range(5, 50, 5), 'slowma': range(20, 200, 20)}, valid=lambda p: p['fastma'] < p['slowma'])
+# print(wf.run())
+# print(wf.summary())
 
 # coin="XMR"
 # polo = Poloniex()
@@ -0,0 +1,92 @@
+import time
+from collections import deque
+
+
+class ChartProfiler:
+    """
+    times the phases of a ChartFrame's update and draw, e.g.
+    ChartProfiler(chart_frame, ['_fetch_chart', '_resample_data', ...]).attach()
+    the timed wrappers are put on that one frame instance, so a frame that isn't attached runs its methods
+    untouched and pays nothing
+    """
+    # phases that run before draw_chart rather than inside it
+    outside_draw = ('_fetch_chart', '_update_labels')
+
+    def __init__(self, chart_frame, phases, history=600):
+        self.chart_frame = chart_frame
+        self.phases = list(phases)
+        self.history = deque(maxlen=history)
+        self.attached = False
+        self._pending = dict((phase, 0.0) for phase in self.phases)
+
+    def attach(self):
+        if self.attached:
+            return
+        for phase in self.phases:
+            setattr(self.chart_frame, phase, self._timed(phase, getattr(self.chart_frame, phase)))
+        self.chart_frame.draw_chart = self._framed(self.chart_frame.draw_chart)
+        self.attached = True
+
+    def detach(self):
+        if not self.attached:
+            return
+        # deleting the instance attributes uncovers the class' own methods again
+        for phase in self.phases + ['draw_chart']:
+            delattr(self.chart_frame, phase)
+        self.chart_frame.canvas.delete("profile")
+        self.attached = False
+
+    def _timed(self, phase, method):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._pending[phase] += time.perf_counter() - start
+        return timed
+
+    def _framed(self, method):
+        # a frame ends with each draw_chart, phases timed since the last one (data fetches etc.) count towards it
+        def framed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._end_frame(time.perf_counter() - start)
+        return framed
+
+    def _end_frame(self, draw_time):
+        canvas = self.chart_frame.canvas
+        frame = {'time': time.time(), 'items': len(canvas.find_withtag("chart"))}
+        frame.update(self._pending)
+        inside = sum(self._pending[phase] for phase in self.phases if phase not in self.outside_draw)
+        frame['other'] = max(0.0, draw_time - inside)
+        frame['total'] = draw_time + sum(self._pending[phase] for phase in self.outside_draw)
+        self.history.append(frame)
+        self._pending = dict((phase, 0.0) for phase in self.phases)
+        self._overlay(frame)
+
+    def _overlay(self, frame):
+        canvas = self.chart_frame.canvas
+        canvas.delete("profile")
+        text = "frame {0:.1f}ms  items {1}".format(frame['total'] * 1000, frame['items'])
+        for phase in self.phases + ['other']:
+            text += "\n{0:<15}{1:6.1f}ms".format(phase.strip('_'), frame[phase] * 1000)
+        canvas.create_text(self.chart_frame.width * 0.99 - 4, self.chart_frame.height * 0.01 + 4, text=text,
+                           anchor='ne', justify='left', font=("mono", 7), fill='#4040a0', tags='profile')
+
+    def summary(self):
+        # mean milliseconds per phase over the kept history
+        if len(self.history) == 0:
+            return {}
+        columns = self.phases + ['other', 'total', 'items']
+        return dict((c, sum(f[c] for f in self.history) / len(self.history) * (1 if c == 'items' else 1000))
+                    for c in columns)
+
+    def dump(self, filename):
+        columns = ['time', 'total'] + self.phases + ['other', 'items']
+        with open(filename, 'w') as f:
+            f.write(",".join(c.strip('_') for c in columns) + "\n")
+            for frame in self.history:
+                f.write(",".join(str(frame[c]) if c == 'items' else "{0:.6f}".format(frame[c])
+                                 for c in columns) + "\n")
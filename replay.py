@@ -0,0 +1,122 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+
+class ReplaySource:
+    def __init__(self, pdat, markets, start, end=None, speed=60, fps=5):
+        self.pdat = pdat
+        self.markets = list(markets)
+        self.start_time = start
+        self.end_time = end
+        self.speed = speed
+        self.fps = fps
+        self.frame_interval_ms = int(1000 / fps)
+        self.sim_time = start
+
+        self.frame = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.missed = 0
+        self._seen = {}
+        self.active = False
+        self._thread = None
+
+        # charts keep some history from before the start so the indicators have something to work with
+        self.history = {}
+        self._ticker_columns = {}
+        for market in self.markets:
+            chart_data = pdat._read_chart(market, start - pdat.chart_retention, end)
+            if chart_data.shape[0] > 0:
+                self.history[market] = chart_data
+                self._ticker_columns[market] = self._ticker_history(chart_data)
+        self.markets = [m for m in self.markets if m in self.history]
+        self._times = dict((m, self.history[m].index.values) for m in self.markets)
+        self._steps = dict((m, -1) for m in self.markets)
+
+    def _ticker_history(self, chart_data):
+        # everything the ticker shows, worked out for every candle up front
+        close = chart_data["close"].astype(float)
+        day_ago = close.asof(chart_data.index - timedelta(hours=24)).values
+        ticker = pd.DataFrame({
+            'last': close.values,
+            'highestBid': close.values,
+            'lowestAsk': close.values,
+            'baseVolume': chart_data["volume"].astype(float).rolling('1D').sum().values,
+            'quoteVolume': chart_data["quoteVolume"].astype(float).rolling('1D').sum().values,
+            'high24hr': chart_data["high"].astype(float).rolling('1D').max().values,
+            'low24hr': chart_data["low"].astype(float).rolling('1D').min().values,
+            'percentChange': close.values / day_ago - 1,
+            'isFrozen': 0.0,
+            'id': 0.0}, index=chart_data.index)
+        return ticker.fillna(0).values
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self.active = True
+        self._thread.start()
+
+    def stop(self):
+        self.active = False
+
+    def _run(self):
+        # the replay clock is worked out from the wall clock each frame, never by adding up sleeps,
+        # so it stays right however long publishing a frame takes
+        wall_start = time.time()
+        slot = 0
+        while self.active:
+            self.sim_time = self.start_time + timedelta(seconds=(time.time() - wall_start) * self.speed)
+            if self.end_time is not None and self.sim_time > self.end_time:
+                self.sim_time = self.end_time
+                self.active = False
+            self._publish()
+
+            slot += 1
+            behind = int((time.time() - wall_start) * self.fps) - slot
+            if behind > 0:
+                # publishing took longer than a frame, skip the slots we missed
+                self.dropped += behind
+                slot += behind
+            time.sleep(max(0.0, wall_start + slot / self.fps - time.time()))
+        print("Replay stopped.")
+
+    def _publish(self):
+        sim_time = np.datetime64(self.sim_time)
+        rows = []
+        advanced = 0
+        for market in self.markets:
+            step = int(np.searchsorted(self._times[market], sim_time, side='right')) - 1
+            if step < 0:
+                continue
+            if self._steps[market] >= 0:
+                advanced = max(advanced, step - self._steps[market])
+            if step != self._steps[market]:
+                self._steps[market] = step
+                self.pdat.charts[market] = self.history[market].iloc[:step + 1]
+                self.pdat.publish_chart(market, self.pdat.charts[market])
+            rows.append(self._ticker_columns[market][step])
+        if len(rows) == 0:
+            return
+        # more than one new candle in a frame means the ones in between were never shown on their own
+        self.coalesced += max(0, advanced - 1)
+        markets = [m for m in self.markets if self._steps[m] >= 0]
+        ticker = pd.DataFrame(np.array(rows), index=markets,
+                              columns=['last', 'highestBid', 'lowestAsk', 'baseVolume', 'quoteVolume',
+                                       'high24hr', 'low24hr', 'percentChange', 'isFrozen', 'id'])
+        self.pdat.charts_updated = datetime.now()
+        self.pdat.publish_ticker(ticker)
+        self.frame += 1
+
+    def rendered(self, viewer):
+        # viewers call this when they draw, frames published since their last draw were never seen by them
+        last = self._seen.get(viewer)
+        if last is not None and self.frame - last > 1:
+            self.missed += self.frame - last - 1
+        self._seen[viewer] = self.frame
+
+    def stats(self):
+        return {'sim_time': self.sim_time, 'speed': self.speed, 'frames': self.frame,
+                'coalesced': self.coalesced, 'dropped': self.dropped, 'missed': self.missed}
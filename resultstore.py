@@ -0,0 +1,123 @@
+import hashlib
+import inspect
+import json
+import sqlite3
+import time
+import zlib
+import numpy as np
+
+
+class ResultStore:
+    def __init__(self, path):
+        self._db = sqlite3.connect(path)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                key TEXT PRIMARY KEY,
+                strategy TEXT, market TEXT, params TEXT,
+                tradepct REAL, buyfee REAL, sellfee REAL, candlewidth INTEGER,
+                start TEXT, end TEXT, candles INTEGER,
+                initialvalue REAL, finalvalue REAL, profit REAL, maxdrawdown REAL,
+                created REAL, equity BLOB);
+            CREATE TABLE IF NOT EXISTS params (
+                key TEXT, name TEXT, value REAL,
+                PRIMARY KEY (key, name));
+            CREATE INDEX IF NOT EXISTS runs_market ON runs (market, start);
+            CREATE INDEX IF NOT EXISTS runs_strategy ON runs (strategy, market, profit);
+            CREATE INDEX IF NOT EXISTS params_value ON params (name, value);
+        """)
+
+    def close(self):
+        self._db.close()
+
+    def runtest(self, test_cls, data, market, fast=False, **kwargs):
+        """
+        same as test_cls(data, **kwargs).runtest() but skipped if exactly this run is already stored
+        """
+        settings = self._settings(test_cls, kwargs)
+        key = self.makekey(test_cls, data, settings)
+        row = self._db.execute("SELECT initialvalue, finalvalue, profit FROM runs WHERE key = ?",
+                               (key,)).fetchone()
+        if row is not None:
+            return row
+
+        test = test_cls(data, **kwargs)
+        initialvalue, finalvalue, profit = test.runfast() if fast else test.runtest()
+        equity = test.equitycurve()
+        peaks = np.fmax.accumulate(equity)
+        maxdrawdown = np.nanmin(equity / peaks - 1) * 100
+
+        params = dict((k, v) for k, v in settings.items() if k not in ('tradepct', 'buyfee', 'sellfee', 'candlewidth'))
+        with self._db:
+            self._db.execute("INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (key, self._name(test_cls), market, json.dumps(params, sort_keys=True),
+                              settings['tradepct'], settings['buyfee'], settings['sellfee'], settings['candlewidth'],
+                              str(data.index[0]), str(data.index[-1]), data.shape[0],
+                              initialvalue, finalvalue, profit, maxdrawdown, time.time(),
+                              zlib.compress(equity.astype(np.float32).tobytes())))
+            self._db.executemany("INSERT INTO params VALUES (?, ?, ?)",
+                                 [(key, k, v) for k, v in params.items() if isinstance(v, (int, float))])
+        return initialvalue, finalvalue, profit
+
+    def makekey(self, test_cls, data, settings):
+        candles = hashlib.sha1()
+        for column in ('open', 'high', 'low', 'close'):
+            candles.update(np.ascontiguousarray(data[column].values, dtype=np.float64).tobytes())
+        key = {'strategy': self._name(test_cls), 'source': self._source(test_cls), 'settings': settings,
+               'start': str(data.index[0]), 'end': str(data.index[-1]), 'candles': candles.hexdigest()}
+        return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def has(self, key):
+        return self._db.execute("SELECT 1 FROM runs WHERE key = ?", (key,)).fetchone() is not None
+
+    def best(self, test_cls, market=None):
+        # best run for each market, e.g. the best fastma/slowma per coin
+        query = "SELECT market, params, MAX(profit), maxdrawdown, key FROM runs WHERE strategy = ?"
+        args = [self._name(test_cls)]
+        if market is not None:
+            query += " AND market = ?"
+            args.append(market)
+        query += " GROUP BY market ORDER BY market"
+        return [(m, json.loads(p), profit, dd, key) for m, p, profit, dd, key in self._db.execute(query, args)]
+
+    def runs_for(self, market, since=None):
+        query = "SELECT strategy, params, start, end, profit, maxdrawdown, key FROM runs WHERE market = ?"
+        args = [market]
+        if since is not None:
+            query += " AND start >= ?"
+            args.append(str(since))
+        query += " ORDER BY start"
+        return [(s, json.loads(p), start, end, profit, dd, key)
+                for s, p, start, end, profit, dd, key in self._db.execute(query, args)]
+
+    def runs_with(self, name, value):
+        return [k for k, in self._db.execute("SELECT key FROM params WHERE name = ? AND value = ?", (name, value))]
+
+    def equity(self, key):
+        row = self._db.execute("SELECT equity FROM runs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(zlib.decompress(row[0]), dtype=np.float32)
+
+    def _settings(self, test_cls, kwargs):
+        settings = {}
+        for name, param in inspect.signature(test_cls.__init__).parameters.items():
+            if param.default is not inspect.Parameter.empty:
+                settings[name] = param.default
+        settings.update(kwargs)
+        # numpy numbers from a parameter grid become plain ones, so they go into json and the params table
+        return dict((k, v.item() if isinstance(v, np.generic) else v) for k, v in settings.items())
+
+    def _source(self, test_cls):
+        # a strategy's code is part of the run, an edit to it or to the BackTest it builds on means new runs
+        source = hashlib.sha1()
+        for cls in test_cls.__mro__:
+            try:
+                source.update(inspect.getsource(cls).encode())
+            except (OSError, TypeError):
+                source.update(self._name(cls).encode())
+            if cls.__name__ == 'BackTest':
+                break
+        return source.hexdigest()
+
+    def _name(self, test_cls):
+        return test_cls.__module__ + "." + test_cls.__name__
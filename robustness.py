@@ -0,0 +1,139 @@
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+
+def bootstrap_paths(closes, npaths, length, block=288, rng=None):
+    # stitch together random blocks of the real log returns, a block of 288 five minute candles is one day
+    if rng is None:
+        rng = np.random.RandomState()
+    returns = np.diff(np.log(closes))
+    returns = returns[np.isfinite(returns)]
+    block = min(block, returns.shape[0])
+    nblocks = -(-(length - 1) // block)
+    starts = rng.randint(0, returns.shape[0] - block + 1, size=(nblocks, npaths))
+    picked = returns[starts[:, None, :] + np.arange(block)[None, :, None]]
+    picked = picked.reshape(nblocks * block, npaths)[:length - 1]
+    paths = np.empty((length, npaths))
+    paths[0] = closes[0]
+    paths[1:] = closes[0] * np.exp(np.cumsum(picked, axis=0))
+    return paths
+
+
+def offset_paths(closes, npaths, length, rng=None):
+    # real history, each path starting at a random candle
+    if rng is None:
+        rng = np.random.RandomState()
+    starts = rng.randint(0, closes.shape[0] - length + 1, size=npaths)
+    return closes[starts[None, :] + np.arange(length)[:, None]]
+
+
+def run_paths(test_cls, paths, tradepct=10, btcbalance=0.01, buyfee=0.25, sellfee=0.15, **kwargs):
+    """
+    runs a BackTest strategy over every column of paths (candles x paths) at once
+    same rules as BackTest.runtest, returns arrays of profit and max drawdown (both %) per path
+    """
+    length, npaths = paths.shape
+    signal = np.asarray(test_cls.signals(pd.DataFrame(paths), **kwargs))
+    keep = 1 - (tradepct / 100)
+    buyfeemult = 1 - (buyfee / 100)
+    sellfeemult = 1 - (sellfee / 100)
+
+    # line up each path's signals by their order instead of their time, so that step k below
+    # handles the k-th signal of every path together
+    pathidx, stepidx = np.nonzero(signal.T)
+    counts = np.bincount(pathidx, minlength=npaths)
+    rank = np.arange(pathidx.shape[0]) - np.repeat(np.cumsum(counts) - counts, counts)
+    events = np.full((counts.max() if pathidx.shape[0] > 0 else 0, npaths), -1)
+    events[rank, pathidx] = stepidx
+
+    cols = np.arange(npaths)
+    btc = np.full(npaths, float(btcbalance))
+    coin = np.zeros(npaths)
+    btchistory = np.full((length, npaths), np.nan)
+    coinhistory = np.full((length, npaths), np.nan)
+    btchistory[0] = btc
+    coinhistory[0] = coin
+    for steps in events:
+        active = steps >= 0
+        steps = np.where(active, steps, 0)
+        price = paths[steps, cols]
+        action = np.where(active, signal[steps, cols], 0)
+
+        size = btc * (1 - keep)
+        buys = (action > 0) & (btc > size)
+        btc = np.where(buys, btc - size, btc)
+        coin = np.where(buys, coin + (size / price) * buyfeemult, coin)
+
+        sells = (action < 0) & (coin > 0)
+        btc = np.where(sells, btc + coin * price * sellfeemult, btc)
+        coin = np.where(sells, 0.0, coin)
+
+        btchistory[steps[active], cols[active]] = btc[active]
+        coinhistory[steps[active], cols[active]] = coin[active]
+
+    btchistory = pd.DataFrame(btchistory).ffill().values
+    coinhistory = pd.DataFrame(coinhistory).ffill().values
+    equity = btchistory + coinhistory * paths
+    profit = ((equity[-1] - btcbalance) / btcbalance) * 100
+    drawdown = np.nanmin(equity / np.fmax.accumulate(equity, axis=0) - 1, axis=0) * 100
+    return profit, drawdown
+
+
+def _run_batch(job):
+    test_cls, closes, npaths, length, method, block, seed, kwargs = job
+    rng = np.random.RandomState(seed)
+    if method == 'bootstrap':
+        paths = bootstrap_paths(closes, npaths, length, block, rng)
+    else:
+        paths = offset_paths(closes, npaths, length, rng)
+    return run_paths(test_cls, paths, **kwargs)
+
+
+class MonteCarlo:
+    """
+    runs a BackTest strategy (one with signals()) over npaths price paths made from data's closes,
+    'bootstrap' stitches random blocks of real returns, 'offset' takes windows of history at random starts
+    only closes are resampled so stoploss/takeprofit/trailingstop are not simulated here
+    """
+    def __init__(self, test_cls, data, npaths=1000, length=None, method='bootstrap', block=288,
+                 batch=32, processes=None, seed=0, candlewidth=5, **kwargs):
+        self.test_cls = test_cls
+        self.closes = data["close"].asfreq(str(candlewidth) + 'Min', method='pad').dropna().values.astype(float)
+        self.npaths = npaths
+        if length is None:
+            length = self.closes.shape[0] if method == 'bootstrap' else self.closes.shape[0] // 2
+        self.length = length
+        self.method = method
+        self.block = block
+        self.batch = batch
+        self.processes = processes
+        self.seed = seed
+        self.kwargs = kwargs
+        self.results = None
+
+    def run(self):
+        jobs = []
+        for i, start in enumerate(range(0, self.npaths, self.batch)):
+            jobs.append((self.test_cls, self.closes, min(self.batch, self.npaths - start), self.length,
+                         self.method, self.block, self.seed + i, self.kwargs))
+        # batches are independent and seeded, so the answer is the same however many cores run them
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            batches = pool.map(_run_batch, jobs)
+        finally:
+            pool.close()
+            pool.join()
+        self.results = pd.DataFrame({'profit': np.concatenate([p for p, d in batches]),
+                                     'drawdown': np.concatenate([d for p, d in batches])})
+        return self.results
+
+    def actual(self):
+        # the one real price path, for comparison with the distribution
+        profit, drawdown = run_paths(self.test_cls, self.closes[:, None], **self.kwargs)
+        return profit[0], drawdown[0]
+
+    def summary(self):
+        summary = self.results.describe(percentiles=[0.05, 0.25, 0.5, 0.75, 0.95])
+        summary.ix['losing'] = (self.results < 0).mean() * 100
+        return summary
@@ -0,0 +1,100 @@
+import time
+import pandas as pd
+
+
+class MarketScanner:
+    def __init__(self, pdat, base='BTC', top=10, auto_chart=0, min_volume=1.0,
+                 min_change=0.05, volume_spike=1.5, max_spread=0.02, volume_period=600, spike_period=30,
+                 auto_chart_margin=2, auto_chart_hold=300):
+        self.pdat = pdat
+        # rules, every column is compared across the whole ticker at once
+        self.base = base
+        self.min_volume = min_volume
+        self.min_change = min_change
+        self.volume_spike = volume_spike
+        self.max_spread = max_spread
+        self.volume_period = volume_period
+        self.spike_period = spike_period
+
+        self.top = top
+        self.auto_chart = auto_chart
+        # an auto chart is only let go once it is auto_chart_margin places below the cut and has been
+        # for auto_chart_hold seconds, so markets jostling around the cut don't load and drop charts all day
+        self.auto_chart_margin = auto_chart_margin
+        self.auto_chart_hold = auto_chart_hold
+        self.watchlist = pd.DataFrame(columns=['last', 'percentChange', 'baseVolume', 'spike', 'spread', 'score'])
+        self.scan_time = 0.0
+        self._volume_prev = None
+        self._added_fast = None
+        self._added_slow = None
+        self._auto_charts = {}
+
+    def start(self):
+        self.pdat.add_ticker_callback(self.scan)
+
+    def stop(self):
+        self.pdat.remove_ticker_callback(self.scan)
+
+    def scan(self, ticker):
+        start = time.time()
+        if self.base is not None:
+            ticker = ticker[ticker.index.str.startswith(self.base + "_")]
+        ticker = ticker[ticker["isFrozen"] == 0]
+
+        # baseVolume is a rolling 24hr figure, what a tick adds to it is (net of what drops out of the window)
+        # the volume traded since the last one, a spike is a short average of that well ahead of a long one
+        volume = ticker["baseVolume"]
+        if self._volume_prev is None:
+            added = volume * 0
+        else:
+            added = (volume - self._volume_prev.reindex(volume.index)).clip(lower=0).fillna(0)
+        self._volume_prev = volume
+        usual = volume * self.pdat.ticker_update_freq / 86400
+        self._added_fast = self._average(self._added_fast, added, usual, self.spike_period)
+        self._added_slow = self._average(self._added_slow, added, usual, self.volume_period)
+        spike = self._added_fast / self._added_slow.where(self._added_slow > 0)
+        spread = (ticker["lowestAsk"] - ticker["highestBid"]) / ticker["last"].where(ticker["last"] > 0)
+        change = ticker["percentChange"]
+
+        passed = (volume >= self.min_volume) & (spread <= self.max_spread) & \
+                 ((change.abs() >= self.min_change) | (spike >= self.volume_spike))
+        score = change.abs() / self.min_change + (spike - 1) / (self.volume_spike - 1)
+
+        watchlist = pd.DataFrame({'last': ticker["last"], 'percentChange': change, 'baseVolume': volume,
+                                  'spike': spike, 'spread': spread, 'score': score})[passed]
+        self.watchlist = watchlist.sort_values('score', ascending=False).head(self.top)
+        if self.auto_chart > 0 or len(self._auto_charts) > 0:
+            self._chart_leaders()
+        self.scan_time = time.time() - start
+
+    def _average(self, average, value, seed, period):
+        average = seed if average is None else average.reindex(value.index).fillna(seed)
+        return average + (value - average) / period
+
+    def _chart_leaders(self):
+        now = time.time()
+        ranked = list(self.watchlist.index)
+        keep = set(ranked[:self.auto_chart + self.auto_chart_margin])
+        for market in ranked[:self.auto_chart]:
+            if market not in self.pdat.charts:
+                self.pdat.add_chart(market, visible=False)
+                self._auto_charts[market] = now
+        # let go of charts we opened once they have been out of reach for a while,
+        # unless someone is looking at them
+        for market in list(self._auto_charts):
+            if market in keep:
+                self._auto_charts[market] = now
+            elif now - self._auto_charts[market] >= self.auto_chart_hold:
+                self._release(market)
+
+    def set_auto_chart(self, count):
+        # off by default, each auto chart is a 90 day download and then polled for as long as it's kept
+        self.auto_chart = count
+        if count == 0:
+            for market in list(self._auto_charts):
+                self._release(market)
+
+    def _release(self, market):
+        if self._auto_charts.pop(market, None) is not None:
+            if market in self.pdat.charts and self.pdat.chart_visible.get(market, 0) == 0:
+                self.pdat.remove_chart(market)
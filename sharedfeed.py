@@ -0,0 +1,262 @@
+import multiprocessing
+import queue
+import threading
+import time
+from datetime import timedelta
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+import pandas as pd
+
+from arrowexport import ArrowExport
+from polodata import PoloData
+
+TICKER_FIELDS = ['last', 'highestBid', 'lowestAsk', 'baseVolume', 'quoteVolume',
+                 'high24hr', 'low24hr', 'percentChange', 'isFrozen', 'id']
+CANDLE_FIELDS = ['open', 'high', 'low', 'close', 'volume', 'quoteVolume', 'weightedAverage']
+
+
+class SharedBlock:
+    # a 2d float64 array in shared memory behind a two int64 header, [sequence, rows]
+    # the sequence is odd while the writer is part way through, readers retry until it is even and unchanged
+    def __init__(self, name, cols, rows=None, create=False):
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=16 + rows * cols * 8)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # the writer owns the block, stop this process' tracker unlinking it on exit
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+            rows = (self.shm.size - 16) // (cols * 8)
+        self.rows = rows
+        self.cols = cols
+        self.header = np.ndarray((2,), dtype=np.int64, buffer=self.shm.buf)
+        self.data = np.ndarray((rows, cols), dtype=np.float64, buffer=self.shm.buf, offset=16)
+        if create:
+            self.header[:] = 0
+        else:
+            self.data.setflags(write=False)
+
+    def write(self, values):
+        rows = min(values.shape[0], self.rows)
+        self.header[0] += 1
+        self.data[:rows] = values[values.shape[0] - rows:]
+        self.header[1] = rows
+        self.header[0] += 1
+
+    def sequence(self):
+        return int(self.header[0])
+
+    def read(self):
+        while True:
+            seq = int(self.header[0])
+            if seq % 2 == 0:
+                values = self.data[:int(self.header[1])].copy()
+                if int(self.header[0]) == seq:
+                    return seq, values
+            time.sleep(0)
+
+    def close(self, unlink=False):
+        self.header = None
+        self.data = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _block_name(prefix, market=None):
+    return prefix + ("_ticker" if market is None else "_" + market)
+
+
+def collect(args, kwargs, prefix, markets, chart_path, chart_rows, commands, ticker_freq, charts_freq, retention,
+            arrow_path=None):
+    # runs in the collector process, the only place the exchange is polled and pandas rebuilds happen
+    pdat = PoloData(*args, **kwargs)
+    ticker_block = SharedBlock(_block_name(prefix), len(TICKER_FIELDS), len(markets), create=True)
+    chart_blocks = {}
+
+    def write_ticker(ticker):
+        ticker_block.write(ticker.reindex(markets).reindex(columns=TICKER_FIELDS).fillna(0).values)
+
+    def write_chart(market, chart_data):
+        if market not in chart_blocks:
+            chart_blocks[market] = SharedBlock(_block_name(prefix, market), len(CANDLE_FIELDS) + 1,
+                                               chart_rows, create=True)
+        dates = chart_data.index.values.astype('datetime64[s]').astype(np.int64).astype(np.float64)
+        values = chart_data.reindex(columns=CANDLE_FIELDS).values
+        chart_blocks[market].write(np.column_stack([dates, values]))
+
+    pdat.add_ticker_callback(write_ticker)
+    pdat.add_chart_callback(write_chart)
+    if arrow_path is not None:
+        # the charts only grow in this process, so the arrow files are written from here
+        ArrowExport(pdat, arrow_path).start()
+    pdat.start_ticker(ticker_freq)
+    pdat.start_charts(charts_freq, chart_path, retention)
+
+    while True:
+        command = commands.get()
+        if command[0] == 'stop':
+            break
+        getattr(pdat, command[0])(*command[1:])
+
+    pdat.stop_ticker()
+    pdat.stop_charts()
+    time.sleep(ticker_freq)
+    ticker_block.close(unlink=True)
+    for block in list(chart_blocks.values()):
+        block.close(unlink=True)
+
+
+class SharedCharts:
+    # looks like the PoloData.charts dict, but reads the candles the collector wrote to shared memory
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._markets = {}
+        self._blocks = {}
+        self._frames = {}
+
+    def add(self, market):
+        self._markets[market] = True
+
+    def remove(self, market):
+        self._markets.pop(market, None)
+        self._frames.pop(market, None)
+        block = self._blocks.pop(market, None)
+        if block is not None:
+            block.close()
+
+    def _block(self, market):
+        if market not in self._blocks:
+            try:
+                self._blocks[market] = SharedBlock(_block_name(self.prefix, market), len(CANDLE_FIELDS) + 1)
+            except FileNotFoundError:
+                return None
+        return self._blocks[market]
+
+    def __getitem__(self, market):
+        if market not in self._markets:
+            raise KeyError(market)
+        return self.get(market)
+
+    def get(self, market, default=None):
+        if market not in self._markets:
+            return default
+        block = self._block(market)
+        if block is None:
+            return None
+        # only rebuild the DataFrame when the collector has written something new
+        seq, chart_data = self._frames.get(market, (None, None))
+        if seq != block.sequence():
+            seq, values = block.read()
+            index = pd.to_datetime(values[:, 0].astype(np.int64), unit='s')
+            index.name = "Date"
+            chart_data = pd.DataFrame(values[:, 1:], index=index, columns=CANDLE_FIELDS)
+            self._frames[market] = (seq, chart_data)
+        return chart_data
+
+    def __contains__(self, market):
+        return market in self._markets
+
+    def __iter__(self):
+        return iter(list(self._markets))
+
+    def __len__(self):
+        return len(self._markets)
+
+
+class SharedPoloData(PoloData):
+    """
+    PoloData for the gui process when the collectors run in a separate process (start_collector)
+    ticker and charts are read from shared memory, balances, orders and trading stay in this process
+    """
+    def __init__(self, *args, **kwargs):
+        PoloData.__init__(self, *args, **kwargs)
+        self._args = args
+        self._kwargs = kwargs
+        self.prefix = "polobot_" + str(id(self))
+        self.feed_markets = sorted(pc + "_" + sc for pc in self.markets for sc in self.markets[pc].index)
+        self.charts = SharedCharts(self.prefix)
+        self._commands = None
+        self._collector = None
+        self._ticker_block = None
+
+    def start_collector(self, chart_path, ticker_freq=1, charts_freq=60, retention=None, arrow_path=None):
+        # forks, so call this before any threads or tk windows are started
+        self.chart_path = chart_path
+        if retention is not None:
+            self.chart_retention = retention
+        chart_rows = int(self.chart_retention / timedelta(seconds=self.chart_candle)) + 1
+        context = multiprocessing.get_context('fork')
+        self._commands = context.Queue()
+        self._collector = context.Process(target=collect,
+                                          args=(self._args, self._kwargs, self.prefix, self.feed_markets, chart_path,
+                                                chart_rows, self._commands, ticker_freq, charts_freq,
+                                                self.chart_retention, arrow_path))
+        self._collector.daemon = True
+        self._collector.start()
+        for market in list(self.charts):
+            self._commands.put(('add_chart', market, True))
+
+        self._ticker_thread = threading.Thread(target=self._read_ticker)
+        self._ticker_thread.setDaemon(True)
+        self.ticker_active = True
+        self._ticker_thread.start()
+
+    def stop_collector(self):
+        self.ticker_active = False
+        if self._commands is not None:
+            self._commands.put(('stop',))
+
+    def stop_ticker(self):
+        self.stop_collector()
+
+    def stop_charts(self):
+        self.stop_collector()
+
+    def _read_ticker(self):
+        # only copies a few kB out of shared memory when the sequence moves, no network and no parsing
+        seq = None
+        while self.ticker_active:
+            if self._ticker_block is None:
+                try:
+                    self._ticker_block = SharedBlock(_block_name(self.prefix), len(TICKER_FIELDS))
+                except FileNotFoundError:
+                    time.sleep(0.1)
+                    continue
+            if self._ticker_block.sequence() != seq:
+                seq, values = self._ticker_block.read()
+                if values.shape[0] == len(self.feed_markets):
+                    self.publish_ticker(pd.DataFrame(values, index=self.feed_markets, columns=TICKER_FIELDS))
+            time.sleep(0.1)
+        print("Ticker thread stopped.")
+
+    def add_chart(self, market, visible=True):
+        self.charts.add(market)
+        if visible:
+            self.chart_visible[market] = self.chart_visible.get(market, 0) + 1
+        self._send('add_chart', market, visible)
+
+    def prefetch_charts(self, markets, visible=False, workers=4):
+        for market in markets:
+            self.charts.add(market)
+            if visible:
+                self.chart_visible[market] = self.chart_visible.get(market, 0) + 1
+        self._send('prefetch_charts', markets, visible, workers)
+
+    def set_chart_visible(self, market, visible):
+        count = self.chart_visible.get(market, 0) + (1 if visible else -1)
+        self.chart_visible[market] = max(count, 0)
+        self._send('set_chart_visible', market, visible)
+
+    def remove_chart(self, market):
+        if market is not None:
+            self.charts.remove(market)
+            self.chart_visible.pop(market, None)
+            self._chart_pages.pop(market, None)
+            self._send('remove_chart', market)
+
+    def _send(self, *command):
+        if self._commands is not None:
+            try:
+                self._commands.put_nowait(command)
+            except queue.Full:
+                pass
@@ -0,0 +1,79 @@
+from alerts import AlertEngine
+
+
+def engine(*levels, **kwargs):
+    alerts = AlertEngine(None)
+    for level in levels:
+        alerts.add("BTC_ETH", level, **kwargs)
+    return alerts
+
+
+def fired(alerts):
+    return sorted(alert.level for alert in alerts.poll())
+
+
+def test_first_value_only_sets_the_baseline():
+    alerts = engine(1.0, direction='above')
+    alerts.update("BTC_ETH", 'last', 2.0)
+    assert fired(alerts) == []
+
+
+def test_above_fires_levels_passed_and_reached():
+    alerts = engine(1.0, 1.5, 2.0, 2.5, direction='above')
+    alerts.update("BTC_ETH", 'last', 1.0)
+    alerts.update("BTC_ETH", 'last', 2.0)
+    # a level at the old value was already there, one at the new value has just been reached
+    assert fired(alerts) == [1.5, 2.0]
+    assert alerts.count() == 2
+    alerts.update("BTC_ETH", 'last', 3.0)
+    assert fired(alerts) == [2.5]
+
+
+def test_below_fires_levels_passed_and_reached():
+    alerts = engine(1.0, 1.5, 2.0, 2.5, direction='below')
+    alerts.update("BTC_ETH", 'last', 2.0)
+    alerts.update("BTC_ETH", 'last', 1.0)
+    assert fired(alerts) == [1.0, 1.5]
+    alerts.update("BTC_ETH", 'last', 0.5)
+    assert fired(alerts) == []
+
+
+def test_no_move_or_wrong_way_fires_nothing():
+    alerts = engine(1.5, direction='above')
+    alerts.update("BTC_ETH", 'last', 1.0)
+    alerts.update("BTC_ETH", 'last', 1.0)
+    alerts.update("BTC_ETH", 'last', 0.5)
+    assert fired(alerts) == []
+    assert alerts.count() == 1
+
+
+def test_repeated_levels_all_fire_once():
+    alerts = engine(1.5, 1.5, 1.5, direction='above')
+    alerts.update("BTC_ETH", 'last', 1.0)
+    alerts.update("BTC_ETH", 'last', 1.5)
+    assert fired(alerts) == [1.5, 1.5, 1.5]
+    alerts.update("BTC_ETH", 'last', 1.0)
+    alerts.update("BTC_ETH", 'last', 2.0)
+    assert fired(alerts) == []
+
+
+def test_removed_alert_does_not_fire():
+    alerts = AlertEngine(None)
+    keep = alerts.add("BTC_ETH", 1.5, direction='above')
+    gone = alerts.add("BTC_ETH", 1.5, direction='above')
+    alerts.remove(gone)
+    alerts.update("BTC_ETH", 'last', 1.0)
+    alerts.update("BTC_ETH", 'last', 2.0)
+    assert alerts.poll() == [keep]
+
+
+def test_fields_and_markets_are_separate():
+    alerts = AlertEngine(None)
+    alerts.add("BTC_ETH", 1.5, field='highestBid', direction='above')
+    alerts.add("BTC_XMR", 1.5, direction='above')
+    alerts.update("BTC_ETH", 'last', 1.0)
+    alerts.update("BTC_ETH", 'last', 2.0)
+    assert fired(alerts) == []
+    alerts.update("BTC_ETH", 'highestBid', 1.0)
+    alerts.update("BTC_ETH", 'highestBid', 2.0)
+    assert fired(alerts) == [1.5]
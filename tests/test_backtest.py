@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from polodata import SMACrossoverBackTest
+
+
+def candles(n=4000, seed=0):
+    rng = np.random.RandomState(seed)
+    close = 0.01 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open = np.concatenate(([close[0]], close[:-1]))
+    high = np.maximum(open, close) * (1 + np.abs(rng.normal(0, 0.005, n)))
+    low = np.minimum(open, close) * (1 - np.abs(rng.normal(0, 0.005, n)))
+    volume = rng.rand(n)
+    return pd.DataFrame({'open': open, 'high': high, 'low': low, 'close': close, 'volume': volume,
+                         'quoteVolume': volume / close, 'weightedAverage': close},
+                        index=pd.date_range("2017-01-01", periods=n, freq="5Min", name="Date"))
+
+
+@pytest.mark.parametrize("stops", [
+    {},
+    {'stoploss': 2},
+    {'takeprofit': 3},
+    {'trailingstop': 1.5},
+    {'stoploss': 1, 'takeprofit': 2, 'trailingstop': 1.5},
+])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_runfast_matches_runtest(stops, seed):
+    data = candles(seed=seed)
+    slow = SMACrossoverBackTest(data, fastma=10, slowma=40, **stops)
+    fast = SMACrossoverBackTest(data, fastma=10, slowma=40, **stops)
+    assert np.allclose(slow.runtest(), fast.runfast())
+    assert len(slow.changes) == len(fast.changes)
+    for a, b in zip(slow.changes, fast.changes):
+        assert a[0] == b[0]
+        assert np.allclose(a[1:], b[1:])
+    assert np.allclose(slow.equitycurve(), fast.equitycurve())
+
+
+def test_stops_exit_before_the_sell_signal():
+    data = candles(seed=3)
+    plain = SMACrossoverBackTest(data, fastma=10, slowma=40)
+    stopped = SMACrossoverBackTest(data, fastma=10, slowma=40, stoploss=0.5, takeprofit=0.5)
+    plain.runfast()
+    stopped.runfast()
+    plain_exits = [step for step, btc, coin in plain.changes if coin == 0]
+    stopped_exits = [step for step, btc, coin in stopped.changes if coin == 0]
+    assert stopped_exits[0] < plain_exits[0]
@@ -0,0 +1,95 @@
+import os
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytest
+
+from polodata import CHART_FIELDS, PoloData
+
+
+@pytest.fixture
+def timezone():
+    # local times are what the charts are indexed by, so the tests pick the zone
+    saved = os.environ.get('TZ')
+
+    def use(zone):
+        os.environ['TZ'] = zone
+        time.tzset()
+    yield use
+    if saved is None:
+        del os.environ['TZ']
+    else:
+        os.environ['TZ'] = saved
+    time.tzset()
+
+
+def raw_candles(start, n, freq=300, seed=0):
+    rng = np.random.RandomState(seed)
+    return [dict([('date', start + i * freq)] + [(field, float(value)) for field, value in
+                                                 zip(CHART_FIELDS, rng.rand(len(CHART_FIELDS)))])
+            for i in range(n)]
+
+
+def old_decode(raw_chart_data, freq=300):
+    # how _retrieve_chart_data decoded returnChartData before it was vectorised
+    chart_data = pd.DataFrame(raw_chart_data, dtype=float)
+    chart_data["Date"] = [datetime.fromtimestamp(d) for d in chart_data["date"]]
+    chart_data.set_index(["Date"], inplace=True)
+    chart_data.drop("date", axis=1, inplace=True)
+    chart_data = chart_data.drop_duplicates()
+    freq_str = str(int(freq / 60)) + "Min"
+    return chart_data.asfreq(freq_str, method='pad')[CHART_FIELDS]
+
+
+def assert_same(new, old):
+    assert list(new.columns) == CHART_FIELDS
+    assert (new.index == old.index).all()
+    assert np.allclose(new.values, old.values)
+
+
+def test_decode_matches_old(timezone):
+    timezone('UTC')
+    raw = raw_candles(1500000000, 500)
+    assert_same(PoloData._decode_chart_data(raw), old_decode(raw))
+
+
+def test_decode_fills_gaps_like_old(timezone):
+    timezone('UTC')
+    raw = raw_candles(1500000000, 500)
+    del raw[100:130]
+    del raw[300]
+    new = PoloData._decode_chart_data(raw)
+    assert new.shape[0] == 500
+    assert_same(new, old_decode(raw))
+
+
+def test_decode_drops_repeated_candles_like_old(timezone):
+    timezone('UTC')
+    raw = raw_candles(1500000000, 500)
+    raw = raw[:200] + [dict(raw[199])] + raw[200:]
+    assert_same(PoloData._decode_chart_data(raw), old_decode(raw))
+
+
+def test_decode_empty():
+    chart_data = PoloData._decode_chart_data([])
+    assert chart_data.shape == (0, len(CHART_FIELDS))
+
+
+@pytest.mark.parametrize("zone, start", [
+    ('Europe/London', 1509231600 - 6 * 3600),       # clocks go back at 01:00 utc, 29 Oct 2017
+    ('Europe/London', 1490490000 - 6 * 3600),       # clocks go forward at 01:00 utc, 26 Mar 2017
+    ('Australia/Lord_Howe', 1491062400 - 6 * 3600),  # half an hour back, 2 Apr 2017
+])
+def test_decode_across_dst(timezone, zone, start):
+    timezone(zone)
+    raw = raw_candles(start, 12 * 12)
+    chart_data = PoloData._decode_chart_data(raw)
+    assert chart_data.index.is_unique
+    assert chart_data.index.is_monotonic_increasing
+    # every candle is at the local time datetime.fromtimestamp gives, the first of any repeated hour kept
+    local = pd.DatetimeIndex([datetime.fromtimestamp(c['date']) for c in raw])
+    keep = ~local.duplicated(keep='first')
+    assert (chart_data.index == local[keep]).all()
+    expected = np.array([[c[field] for field in CHART_FIELDS] for c in raw])[keep]
+    assert np.allclose(chart_data.values, expected)
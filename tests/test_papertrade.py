@@ -0,0 +1,107 @@
+import pandas as pd
+import pytest
+from poloniex import PoloniexError
+
+from papertrade import PaperExchange
+
+
+class FakeData:
+    def __init__(self):
+        self.ticker = None
+
+    def set(self, bid, ask, market="BTC_ETH"):
+        self.ticker = pd.DataFrame({'highestBid': [bid], 'lowestAsk': [ask], 'last': [(bid + ask) / 2]},
+                                   index=[market])
+
+
+@pytest.fixture
+def exchange():
+    pdat = FakeData()
+    pdat.set(0.95, 1.0)
+    return PaperExchange(pdat, maker_fee=0.15, taker_fee=0.25)
+
+
+def test_resting_buy_fills_when_the_ask_reaches_it(exchange):
+    account = exchange.account(btc=10)
+    number = account.buy("BTC_ETH", 0.9, 2)['orderNumber']
+    assert account.balances["BTC"] == pytest.approx(8.2)
+    assert account.on_orders["BTC"] == pytest.approx(1.8)
+    assert exchange.match("BTC_ETH", 0.85, 0.91) == []
+    filled = exchange.match("BTC_ETH", 0.85, 0.9)
+    assert [o.number for o in filled] == [number]
+    assert account.on_orders["BTC"] == pytest.approx(0)
+    assert account.balances["ETH"] == pytest.approx(2 * (1 - 0.0015))
+    assert account.trades["BTC_ETH"][0]['rate'] == "0.90000000"
+    assert account.open_orders == {}
+
+
+def test_resting_sell_fills_when_the_bid_reaches_it(exchange):
+    account = exchange.account(btc=0, ETH=3)
+    account.sell("BTC_ETH", 1.1, 3)
+    assert exchange.match("BTC_ETH", 1.09, 1.2) == []
+    assert len(exchange.match("BTC_ETH", 1.15, 1.2)) == 1
+    assert account.balances["BTC"] == pytest.approx(3 * 1.1 * (1 - 0.0015))
+    assert account.on_orders["ETH"] == pytest.approx(0)
+
+
+def test_only_crossed_levels_fill_oldest_first(exchange):
+    first = exchange.account(btc=10)
+    second = exchange.account(btc=10)
+    a = first.buy("BTC_ETH", 0.9, 1)['orderNumber']
+    b = second.buy("BTC_ETH", 0.9, 1)['orderNumber']
+    c = first.buy("BTC_ETH", 0.8, 1)['orderNumber']
+    d = second.buy("BTC_ETH", 0.7, 1)['orderNumber']
+    filled = exchange.match("BTC_ETH", 0.75, 0.8)
+    assert [o.number for o in filled] == [c, a, b]
+    assert list(second.open_orders) == [d]
+    assert exchange.fills == 3
+    # the levels that filled are gone, a move back doesn't fill them again
+    assert exchange.match("BTC_ETH", 0.75, 0.8) == []
+
+
+def test_cancelled_order_does_not_fill(exchange):
+    account = exchange.account(btc=10)
+    number = account.buy("BTC_ETH", 0.9, 1)['orderNumber']
+    account.cancel_order(number)
+    assert account.balances["BTC"] == pytest.approx(10)
+    assert exchange.match("BTC_ETH", 0.5, 0.6) == []
+    with pytest.raises(PoloniexError):
+        account.cancel_order(number)
+
+
+def test_moved_order_fills_at_its_new_price(exchange):
+    account = exchange.account(btc=10)
+    number = account.buy("BTC_ETH", 0.8, 1)['orderNumber']
+    moved = account.move_order(number, 0.9)['orderNumber']
+    assert exchange.match("BTC_ETH", 0.85, 0.9)[0].number == moved
+    assert account.balances["BTC"] == pytest.approx(9.1)
+
+
+def test_crossing_order_takes_at_the_quote(exchange):
+    account = exchange.account(btc=10)
+    result = account.buy("BTC_ETH", 1.2, 2)
+    assert result['amountUnfilled'] == '0.00000000'
+    assert result['resultingTrades'][0]['rate'] == "1.00000000"
+    assert account.balances["BTC"] == pytest.approx(8)
+    assert account.balances["ETH"] == pytest.approx(2 * (1 - 0.0025))
+    assert account.open_orders == {}
+
+
+def test_not_enough_funds(exchange):
+    account = exchange.account(btc=1)
+    with pytest.raises(PoloniexError):
+        account.buy("BTC_ETH", 0.9, 2)
+    assert account.balances["BTC"] == 1
+    assert account.open_orders == {}
+
+
+def test_ticker_matches_only_markets_that_moved(exchange):
+    account = exchange.account(btc=10)
+    account.buy("BTC_ETH", 0.9, 1)
+    exchange.pdat.set(0.95, 1.0)
+    exchange.on_ticker(exchange.pdat.ticker)
+    assert exchange.fills == 0
+    exchange.pdat.set(0.85, 0.89)
+    exchange.on_ticker(exchange.pdat.ticker)
+    assert exchange.fills == 1
+    assert account.position("BTC_ETH") == pytest.approx(1 - 0.0015)